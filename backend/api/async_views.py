@@ -0,0 +1,215 @@
+"""Асинхронные представления чтения для запуска под ASGI.
+
+Анонимные JSON-запросы отдаются из того же кеша ответов, что заполняют
+синхронные представления (api.mixins), а при промахе данные читаются
+асинхронным ORM. Остальное - запросы с токеном, запись, курсорную
+пагинацию, ошибки и неверные параметры - обрабатывает синхронное
+представление DRF в пуле потоков, поэтому тела ответов совпадают.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.filters import RecipeFilter
+from api.mixins import cached_http_response, get_cache_key, make_cache_entry
+from api.pagination import CustomPageNumberPagination, KeysetPagination
+from api.serializers import (IngredientsSerializer, RecipeSerializer,
+                             TagsSerializer)
+from api.views import (IngredientsListRetrieve, RecipeViewSet,
+                       TagsListRetrieve, annotate_user_flags)
+from recipes.cache import can_store, get_version
+from recipes.indexes import ingredient_index
+from recipes.models import Ingredient, Tag
+
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+    'delete': 'destroy'
+}
+
+
+class AsyncReadView:
+    """Асинхронная обёртка над действием ViewSet с VersionedCacheMixin."""
+
+    def __init__(self, viewset, actions, detail, basename, load=None):
+        initkwargs = {
+            'basename': basename,
+            'detail': detail,
+            'suffix': 'Instance' if detail else 'List',
+        }
+        self.view = viewset(**initkwargs)
+        self.viewset = viewset
+        self.actions = actions
+        self.sync_view = sync_to_async(viewset.as_view(actions, **initkwargs))
+        self.renderers = [renderer() for renderer in viewset.renderer_classes]
+        self.negotiator = viewset.content_negotiation_class()
+        self.load = load
+
+    def select_renderer(self, request):
+        if request.method not in ('GET', 'HEAD') or (
+                'HTTP_AUTHORIZATION' in request.META):
+            return None
+        try:
+            renderer, media_type = self.negotiator.select_renderer(
+                request, self.renderers
+            )
+        except NotAcceptable:
+            return None
+        if renderer.format != 'json' or media_type != renderer.media_type:
+            return None
+        return renderer
+
+    def lookup(self, request):
+        versions = [get_version(name) for name in self.view.cache_versions]
+        key = get_cache_key(request, versions, self.view.cache_vary_headers)
+        return key, cache.get(key)
+
+    def as_view(self):
+        async def view(request, *args, **kwargs):
+            return await self.dispatch(request, *args, **kwargs)
+        # Запись и так уходит в представление DRF, которое без CSRF.
+        view.csrf_exempt = True
+        # Имена эндпоинтов в метриках как у представлений DRF.
+        view.cls = self.viewset
+        view.actions = self.actions
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        drf_request = Request(request)
+        renderer = self.select_renderer(drf_request)
+        if renderer is None:
+            return await self.sync_view(request, *args, **kwargs)
+        drf_request.accepted_renderer = renderer
+        if not self.view.is_cacheable(drf_request):
+            return await self.sync_view(request, *args, **kwargs)
+        # Бэкенды кеша в Django синхронные: версии и ответ читаются за один
+        # переход в пул потоков, а не за три.
+        key, entry = await sync_to_async(
+            self.lookup, thread_sensitive=False
+        )(request)
+        status = 'HIT'
+        if entry is None:
+            data = None
+            if self.load is not None:
+                data = await self.load(drf_request, *args, **kwargs)
+            if data is None:
+                return await self.sync_view(request, *args, **kwargs)
+            status = 'MISS'
+            entry = make_cache_entry(renderer.render(data))
+            if await sync_to_async(can_store)(self.view.cache_versions):
+                await cache.aset(
+                    key, entry, self.view.cache_timeout or settings.CACHE_TTL
+                )
+        return cached_http_response(
+            request, entry, status, renderer.media_type
+        )
+
+
+async def load_tags(request):
+    return TagsSerializer(
+        [tag async for tag in Tag.objects.all()], many=True
+    ).data
+
+
+async def load_ingredients(request):
+    # Индекс в памяти; в БД он ходит только при перестройке снимка.
+    return await sync_to_async(ingredient_index.search)(
+        request.query_params.get('name', ''),
+        settings.INGREDIENT_SEARCH_LIMIT
+    )
+
+
+def load_instance(model, serializer_class):
+    async def load(request, pk):
+        if request.query_params:
+            return None
+        instance = await model.objects.filter(pk=pk).afirst()
+        if instance is None:
+            return None
+        return serializer_class(instance).data
+    return load
+
+
+async def load_recipes(request):
+    if KeysetPagination.is_requested(request):
+        return None
+    filterset = RecipeFilter(
+        request.query_params,
+        annotate_user_flags(RecipeViewSet.queryset, request.user),
+        request=request
+    )
+    # Слаги тегов проверяются запросом к БД, остальные фильтры - без неё.
+    if 'tags' in request.query_params:
+        valid = await sync_to_async(filterset.is_valid)()
+    else:
+        valid = filterset.is_valid()
+    if not valid:
+        return None
+    queryset = filterset.qs
+    paginator = CustomPageNumberPagination()
+    page_size = paginator.get_page_size(request)
+    number = request.query_params.get(paginator.page_query_param, '1')
+    if not number.isdigit() or int(number) < 1:
+        return None
+    number = int(number)
+    count = await queryset.acount()
+    if number > 1 and (number - 1) * page_size >= count:
+        return None
+    start = (number - 1) * page_size
+    recipes = [recipe async for recipe in queryset[start:start + page_size]]
+    url = request.build_absolute_uri()
+    previous = None
+    if number == 2:
+        previous = remove_query_param(url, paginator.page_query_param)
+    elif number > 2:
+        previous = replace_query_param(
+            url, paginator.page_query_param, number - 1
+        )
+    return {
+        'count': count,
+        'next': replace_query_param(
+            url, paginator.page_query_param, number + 1
+        ) if start + page_size < count else None,
+        'previous': previous,
+        'results': RecipeSerializer(
+            recipes, many=True, context={'request': request}
+        ).data,
+    }
+
+
+async def load_recipe(request, pk):
+    if request.query_params:
+        return None
+    queryset = annotate_user_flags(
+        RecipeViewSet.queryset.filter(pk=pk), request.user
+    )
+    recipes = [recipe async for recipe in queryset]
+    if not recipes:
+        return None
+    return RecipeSerializer(recipes[0], context={'request': request}).data
+
+
+recipe_list = AsyncReadView(
+    RecipeViewSet, LIST_ACTIONS, False, 'recipes', load_recipes
+).as_view()
+recipe_detail = AsyncReadView(
+    RecipeViewSet, DETAIL_ACTIONS, True, 'recipes', load_recipe
+).as_view()
+tag_list = AsyncReadView(
+    TagsListRetrieve, {'get': 'list'}, False, 'tags', load_tags
+).as_view()
+tag_detail = AsyncReadView(
+    TagsListRetrieve, {'get': 'retrieve'}, True, 'tags',
+    load_instance(Tag, TagsSerializer)
+).as_view()
+ingredient_list = AsyncReadView(
+    IngredientsListRetrieve, {'get': 'list'}, False, 'ingredients',
+    load_ingredients
+).as_view()
+ingredient_detail = AsyncReadView(
+    IngredientsListRetrieve, {'get': 'retrieve'}, True, 'ingredients',
+    load_instance(Ingredient, IngredientsSerializer)
+).as_view()
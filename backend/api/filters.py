@@ -1,7 +1,29 @@
 import django_filters
+from django.db.models import F
 from django.forms import CheckboxInput
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
+
+# Счётчики меняются без сброса кэша рецептов: сортировка по ним
+# не кешируется.
+COUNTER_ORDERING_FIELDS = ('favorites_count', 'in_carts_count')
+# Поля счётчиков и даты, по которым можно сортировать ленту рецептов.
+RECIPE_ORDERING_FIELDS = ('pub_date',) + COUNTER_ORDERING_FIELDS
+DEFAULT_RECIPE_ORDERING = ('-pub_date', '-pk')
+
+
+def get_recipe_ordering(params):
+    """Сортировка, которую RecipeFilter задаст выборке по этим параметрам.
+
+    ordering применяется после search и заменяет сортировку по рангу.
+    """
+    ordering = params.get('ordering', '')
+    if ordering.lstrip('-') in RECIPE_ORDERING_FIELDS:
+        return (ordering,) + DEFAULT_RECIPE_ORDERING
+    if params.get('search'):
+        return ('-search_rank',) + DEFAULT_RECIPE_ORDERING
+    return DEFAULT_RECIPE_ORDERING
 
 
 class IngredientsFilter(django_filters.FilterSet):
@@ -24,7 +46,8 @@ class RecipeFilter(django_filters.FilterSet):
     tags = django_filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_tags'
     )
     is_in_shopping_cart = django_filters.BooleanFilter(
         widget=CheckboxInput(),
@@ -36,10 +59,30 @@ class RecipeFilter(django_filters.FilterSet):
         field_name='favorites',
         method='filter_users'
     )
+    search = django_filters.CharFilter(method='filter_search')
+    ordering = django_filters.ChoiceFilter(
+        choices=[
+            (f'{prefix}{field}', f'{prefix}{field}')
+            for field in RECIPE_ORDERING_FIELDS for prefix in ('', '-')
+        ],
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_in_shopping_cart', 'is_favorited')
+        fields = (
+            'author', 'tags', 'is_in_shopping_cart', 'is_favorited', 'search',
+            'ordering'
+        )
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        if any(tag.bit is None for tag in value):
+            return queryset.filter(tags__in=value).distinct()
+        return queryset.alias(
+            tags_match=F('tags_mask').bitand(Tag.get_mask(value))
+        ).filter(tags_match__gt=0)
 
     def filter_users(self, queryset, name, value):
         user = getattr(self.request, 'user', None)
@@ -47,3 +90,11 @@ class RecipeFilter(django_filters.FilterSet):
             return queryset.all()
         lookup = '__'.join([name, 'user'])
         return queryset.filter(**{lookup: user})
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value).order_by(
+            '-search_rank', *DEFAULT_RECIPE_ORDERING
+        )
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(value, *DEFAULT_RECIPE_ORDERING)
@@ -0,0 +1,152 @@
+import multiprocessing
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import (DEFAULT_DB_ALIAS, OperationalError, connection,
+                       connections, transaction)
+
+ALIAS = 'bench_sqlite'
+ROWS = 10
+
+SQLITE_MODES = (
+    ('rollback journal', {'pragmas': {'journal_mode': 'DELETE'}}),
+    ('WAL + IMMEDIATE', settings.DATABASES_SQL['default']['OPTIONS']),
+)
+
+
+def write_worker(path, options, transactions, results):
+    connections.settings[ALIAS] = connections.configure_settings({
+        DEFAULT_DB_ALIAS: settings.DATABASES[DEFAULT_DB_ALIAS],
+        ALIAS: {
+            'ENGINE': 'foodgram_backend.sqlite',
+            'NAME': path,
+            'OPTIONS': options,
+        },
+    })[ALIAS]
+    done = locked = 0
+    start = time.perf_counter()
+    for number in range(transactions):
+        row = number % ROWS
+        try:
+            # Чтение перед записью, как у get() + save() в ORM.
+            with transaction.atomic(using=ALIAS):
+                with connections[ALIAS].cursor() as cursor:
+                    cursor.execute(
+                        'SELECT value FROM bench WHERE id = %s', [row]
+                    )
+                    cursor.execute(
+                        'UPDATE bench SET value = value + 1 WHERE id = %s',
+                        [row]
+                    )
+            done += 1
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            locked += 1
+    results.put((done, locked, time.perf_counter() - start))
+    connections[ALIAS].close()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время запроса с новым и переиспользованным '
+            'подключением к настроенной БД и ошибки "database is locked" '
+            'у SQLite с журналом отката и с WAL при параллельной записи')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument(
+            '--transactions', type=int, default=200,
+            help='Транзакций записи на процесс'
+        )
+
+    def handle(self, *args, **options):
+        self.bench_connections(options['repeat'])
+        self.bench_sqlite_writers(options['workers'], options['transactions'])
+
+    def bench_connections(self, repeat):
+        self.stdout.write(f'Подключение к {connection.vendor}:')
+        settings_dict = connection.settings_dict
+        saved = {
+            key: settings_dict[key]
+            for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')
+        }
+        modes = (
+            ('новое на каждый запрос', 0, False),
+            ('переиспользуемое', max(saved['CONN_MAX_AGE'] or 0, 60),
+             saved['CONN_HEALTH_CHECKS']),
+        )
+        try:
+            for title, max_age, health_checks in modes:
+                settings_dict['CONN_MAX_AGE'] = max_age
+                settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+                connection.close()
+                timings = []
+                for _ in range(repeat):
+                    # Те же сигналы, по которым Django закрывает
+                    # подключения между запросами.
+                    start = time.perf_counter()
+                    request_started.send(sender=self.__class__)
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    request_finished.send(sender=self.__class__)
+                    timings.append(time.perf_counter() - start)
+                p99 = statistics.quantiles(timings, n=100)[98]
+                self.stdout.write(
+                    f'  {title:<24} медиана '
+                    f'{statistics.median(timings) * 1000:.3f} мс, '
+                    f'p99 {p99 * 1000:.3f} мс'
+                )
+        finally:
+            settings_dict.update(saved)
+            connection.close()
+
+    def bench_sqlite_writers(self, workers, transactions):
+        self.stdout.write(
+            f'SQLite, {workers} процессов по {transactions} транзакций:'
+        )
+        context = multiprocessing.get_context('fork')
+        connections.close_all()
+        with tempfile.TemporaryDirectory() as directory:
+            for number, (title, options) in enumerate(SQLITE_MODES):
+                path = str(Path(directory) / f'bench{number}.sqlite3')
+                with sqlite3.connect(path) as db:
+                    db.execute(
+                        'PRAGMA journal_mode = '
+                        f'{options["pragmas"]["journal_mode"]}'
+                    )
+                    db.execute(
+                        'CREATE TABLE bench '
+                        '(id INTEGER PRIMARY KEY, value INTEGER)'
+                    )
+                    db.executemany(
+                        'INSERT INTO bench VALUES (?, 0)',
+                        [(row,) for row in range(ROWS)]
+                    )
+                results = context.Queue()
+                processes = [
+                    context.Process(
+                        target=write_worker,
+                        args=(path, options, transactions, results)
+                    )
+                    for _ in range(workers)
+                ]
+                start = time.perf_counter()
+                for process in processes:
+                    process.start()
+                stats = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+                elapsed = time.perf_counter() - start
+                done = sum(item[0] for item in stats)
+                locked = sum(item[1] for item in stats)
+                self.stdout.write(
+                    f'  {title:<24} {done / elapsed:8.1f} транз/с, '
+                    f'"database is locked": {locked}'
+                )
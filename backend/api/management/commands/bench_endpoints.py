@@ -0,0 +1,559 @@
+import http.client
+import json
+import platform
+import re
+import statistics
+import threading
+import time
+from contextlib import ExitStack
+from itertools import combinations
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import connections, reset_queries
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscription
+
+User = get_user_model()
+
+BASELINE_DIR = Path(__file__).resolve().parents[2] / 'benchmarks'
+BENCH_EMAIL = '@bench.invalid'
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+# Картинка 1x1 из postman_collection.
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAA'
+    'ggCByxOyYQAAAABJRU5ErkJggg=='
+)
+PRESET_RECIPES = 5
+LATENCY_METRICS = ('p50', 'p95', 'p99')
+# Меньше двух замеров на эндпоинт не дают перцентилей.
+MIN_REPEAT = 2
+
+RECIPE_FILTERS = (
+    ('author', 'author={author}'),
+    ('tags', 'tags={tag}&tags={other_tag}'),
+    ('is_favorited', 'is_favorited=1'),
+    ('is_in_shopping_cart', 'is_in_shopping_cart=1'),
+    ('search', 'search={word}'),
+)
+
+
+class Endpoint:
+    """Запрос к API; setup и teardown выполняются вне замера."""
+
+    def __init__(self, name, method, path, status=200, auth=True,
+                 data=None, setup=None, teardown=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.status = status
+        self.auth = auth
+        self.data = data
+        self.setup = setup
+        self.teardown = teardown
+
+
+def recipe_payload(context, image=True):
+    payload = {
+        'ingredients': [
+            {'id': pk, 'amount': 10} for pk in context['ingredients']
+        ],
+        'tags': context['tag_ids'],
+        'name': 'Рецепт для замера',
+        'text': 'Описание рецепта для замера',
+        'cooking_time': 10,
+    }
+    if image:
+        payload['image'] = IMAGE
+    return payload
+
+
+def delete_created(context, body):
+    Recipe.objects.filter(pk=json.loads(body)['id']).delete()
+
+
+def user_recipes(model, add, batch=False):
+    def change(context, body=None):
+        recipes = context['batch'] if batch else [context['recipe']]
+        if add:
+            model.objects.add_recipes(context['user'].pk, recipes)
+        else:
+            model.objects.remove_recipes(context['user'].pk, recipes)
+    return change
+
+
+def subscribe(context, body=None):
+    Subscription.objects.create(
+        user=context['user'], author_id=context['author']
+    )
+
+
+def unsubscribe(context, body=None):
+    Subscription.objects.filter(
+        user=context['user'], author_id=context['author']
+    ).delete()
+
+
+def get_endpoints():
+    for size in range(len(RECIPE_FILTERS) + 1):
+        for combination in combinations(RECIPE_FILTERS, size):
+            name = '+'.join(name for name, _ in combination) or 'all'
+            query = '&'.join(query for _, query in combination)
+            yield Endpoint(f'recipes?{name}', 'GET', f'/api/recipes/?{query}')
+    yield Endpoint(
+        'recipes?ordering', 'GET', '/api/recipes/?ordering=-favorites_count'
+    )
+    yield Endpoint('recipes?page=2', 'GET', '/api/recipes/?page=2')
+    yield Endpoint('recipes?cursor', 'GET', '/api/recipes/?pagination=cursor')
+    yield Endpoint('recipes anonymous', 'GET', '/api/recipes/', auth=False)
+    yield Endpoint('recipe', 'GET', '/api/recipes/{recipe}/')
+    yield Endpoint(
+        'recipe anonymous', 'GET', '/api/recipes/{recipe}/', auth=False
+    )
+    yield Endpoint('recipe get-link', 'GET', '/api/recipes/{recipe}/get-link/')
+    yield Endpoint(
+        'short link', 'GET', '/s/{short_link}/', status=301, auth=False
+    )
+    yield Endpoint('feed', 'GET', '/api/recipes/feed/')
+    yield Endpoint(
+        'download shopping cart', 'GET',
+        '/api/recipes/download_shopping_cart/'
+    )
+    yield Endpoint('tags', 'GET', '/api/tags/', auth=False)
+    yield Endpoint(
+        'ingredients search', 'GET', '/api/ingredients/?name={prefix}',
+        auth=False
+    )
+    yield Endpoint(
+        'ingredient', 'GET', '/api/ingredients/{ingredient}/', auth=False
+    )
+    yield Endpoint('users', 'GET', '/api/users/')
+    yield Endpoint('user', 'GET', '/api/users/{author}/')
+    yield Endpoint('users me', 'GET', '/api/users/me/')
+    yield Endpoint('subscriptions', 'GET', '/api/users/subscriptions/')
+    # Запись идёт после чтения: она сбрасывает версии кеша ответов.
+    yield Endpoint(
+        'recipe create', 'POST', '/api/recipes/', status=201,
+        data=recipe_payload, teardown=delete_created
+    )
+    yield Endpoint(
+        'recipe update', 'PATCH', '/api/recipes/{own_recipe}/',
+        data=lambda context: recipe_payload(context, image=False)
+    )
+    for title, model, path in (
+            ('favorite', Favorite, 'favorite'),
+            ('shopping cart', ShoppingCart, 'shopping_cart')):
+        yield Endpoint(
+            f'{title} add', 'POST', f'/api/recipes/{{recipe}}/{path}/',
+            status=201, teardown=user_recipes(model, add=False)
+        )
+        yield Endpoint(
+            f'{title} remove', 'DELETE', f'/api/recipes/{{recipe}}/{path}/',
+            status=204, setup=user_recipes(model, add=True)
+        )
+        yield Endpoint(
+            f'{title} batch add', 'POST', f'/api/recipes/{path}/',
+            data=lambda context: {'recipes': context['batch']},
+            teardown=user_recipes(model, add=False, batch=True)
+        )
+    yield Endpoint(
+        'subscribe', 'POST', '/api/users/{author}/subscribe/', status=201,
+        teardown=unsubscribe
+    )
+    yield Endpoint(
+        'unsubscribe', 'DELETE', '/api/users/{author}/subscribe/',
+        status=204, setup=subscribe
+    )
+
+
+class ClientRunner:
+    """Запросы через тестовый клиент DRF с подсчётом SQL-запросов."""
+
+    def __init__(self, url):
+        self.client = APIClient()
+
+    def request(self, method, path, data, token):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        # Клиент сам очищает журнал запросов по request_started, и
+        # CaptureQueriesContext без этого недосчитывает запросы.
+        reset_queries()
+        with ExitStack() as stack:
+            captures = [
+                stack.enter_context(CaptureQueriesContext(connection))
+                for connection in connections.all()
+            ]
+            start = time.perf_counter()
+            response = self.client.generic(
+                method, path,
+                json.dumps(data) if data is not None else '',
+                content_type='application/json', **headers
+            )
+            body = b''.join(response)
+            elapsed = time.perf_counter() - start
+        queries = sum(len(capture.captured_queries) for capture in captures)
+        return response.status_code, body, elapsed, queries
+
+
+class HttpRunner:
+    """Запросы к запущенному серверу; SQL-запросы берутся из Server-Timing
+    (METRICS_ENABLED=True на сервере)."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(
+            parts.hostname, parts.port or 80, timeout=60
+        )
+
+    def request(self, method, path, data, token):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        body = json.dumps(data).encode() if data is not None else None
+        # В поиске по рецептам и ингредиентам кириллица.
+        path = quote(path, safe='/?&=:,+-_.')
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # Сервер закрыл соединение после прошлого ответа.
+            self.connection.close()
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+        content = response.read()
+        elapsed = time.perf_counter() - start
+        match = SERVER_TIMING_QUERIES.search(
+            response.getheader('Server-Timing', '')
+        )
+        return (
+            response.status, content, elapsed,
+            int(match.group(1)) if match else None
+        )
+
+
+RUNNERS = {'client': ClientRunner, 'http': HttpRunner}
+
+
+class Worker(threading.Thread):
+    """Свой пользователь с токеном, корзиной, избранным и рецептом."""
+
+    def __init__(self, number, shared, endpoints, options, barrier):
+        super().__init__()
+        self.number = number
+        self.shared = shared
+        self.endpoints = endpoints
+        self.options = options
+        self.barrier = barrier
+        self.results = {}
+        self.error = None
+
+    def create_context(self):
+        user = User.objects.create_user(
+            username=f'bench{self.number}',
+            email=f'bench{self.number}{BENCH_EMAIL}',
+            first_name='Замер', last_name=str(self.number)
+        )
+        own_recipe = Recipe.objects.create(
+            author=user, name='Свой рецепт', text='Описание',
+            cooking_time=10
+        )
+        own_recipe.tags.set(self.shared['tag_ids'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=own_recipe, ingredient_id=pk, amount=10)
+            for pk in self.shared['ingredients']
+        )
+        Favorite.objects.add_recipes(user.pk, self.shared['preset'])
+        ShoppingCart.objects.add_recipes(user.pk, self.shared['preset'])
+        return {
+            **self.shared,
+            'user': user,
+            'token': Token.objects.create(user=user).key,
+            'own_recipe': own_recipe.pk,
+        }
+
+    def run(self):
+        try:
+            context = self.create_context()
+            runner = RUNNERS[self.options['mode']](self.options['url'])
+            for endpoint in self.endpoints:
+                self.barrier.wait()
+                self.results[endpoint.name] = self.measure(
+                    runner, endpoint, context
+                )
+        except threading.BrokenBarrierError:
+            pass
+        except Exception as error:
+            self.error = error
+            self.barrier.abort()
+        finally:
+            connections.close_all()
+
+    def measure(self, runner, endpoint, context):
+        path = endpoint.path.format(**context)
+        token = context['token'] if endpoint.auth else None
+        timings, queries, errors = [], [], []
+        total = self.options['warmup'] + self.options['repeat']
+        for number in range(total):
+            if endpoint.setup:
+                endpoint.setup(context)
+            data = endpoint.data(context) if endpoint.data else None
+            status, body, elapsed, count = runner.request(
+                endpoint.method, path, data, token
+            )
+            if status != endpoint.status:
+                errors.append(f'{status} {body[:200]!r}')
+            elif endpoint.teardown:
+                endpoint.teardown(context, body)
+            if number < self.options['warmup']:
+                continue
+            timings.append(elapsed)
+            if count is not None:
+                queries.append(count)
+        return timings, queries, errors
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет эндпоинты API через тестовый клиент или по HTTP, '
+            'считает p50/p95/p99, запросы в секунду и SQL-запросы и '
+            'сравнивает их с сохранённым базовым замером')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=RUNNERS, default='client')
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Адрес сервера для --mode http'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Параллельных клиентов в режиме http'
+        )
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--only', help='Только эндпоинты, в имени которых есть строка'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Файл базового замера; по умолчанию '
+                 'api/benchmarks/<mode>.json'
+        )
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Записать результат как новый базовый замер'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.3,
+            help='Допустимое ухудшение задержки и пропускной способности '
+                 '(0.3 = 30%%)'
+        )
+        parser.add_argument(
+            '--min-delta', type=float, default=2.0,
+            help='Меньшее ухудшение задержки в мс не считается регрессией'
+        )
+        parser.add_argument(
+            '--query-threshold', type=int, default=0,
+            help='Сколько SQL-запросов можно добавить к базовому замеру'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < MIN_REPEAT:
+            raise CommandError(f'--repeat должен быть не меньше {MIN_REPEAT}')
+        if options['mode'] == 'client':
+            options['concurrency'] = 1
+        endpoints = [
+            endpoint for endpoint in get_endpoints()
+            if not options['only'] or options['only'] in endpoint.name
+        ]
+        if not endpoints:
+            raise CommandError(f'Нет эндпоинтов с "{options["only"]}"')
+        path = Path(
+            options['baseline']
+            or BASELINE_DIR / f'{options["mode"]}.json'
+        )
+        self.delete_bench_users()
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                results = self.run(endpoints, options)
+        finally:
+            self.delete_bench_users()
+        self.print_results(results)
+        failed = [
+            f'{name}: {errors[0]} (всего {len(errors)})'
+            for name, (*_, errors) in results.items() if errors
+        ]
+        if failed:
+            raise CommandError(
+                'Неожиданные ответы:\n' + '\n'.join(failed)
+            )
+        if options['save']:
+            self.save(path, results, options)
+            return
+        if not path.exists():
+            self.stdout.write(self.style.WARNING(
+                f'Нет базового замера {path}; сохраните его с --save'
+            ))
+            return
+        regressions = self.compare(
+            json.loads(path.read_text(encoding='utf-8'))['endpoints'],
+            results, options
+        )
+        if regressions:
+            raise CommandError(
+                'Ухудшения относительно базового замера:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Нет ухудшений относительно {path}'
+        ))
+
+    def delete_bench_users(self):
+        User.objects.filter(email__endswith=BENCH_EMAIL).delete()
+
+    def get_shared_context(self):
+        recipes = list(Recipe.objects.exclude(
+            author__email__endswith=BENCH_EMAIL
+        ).order_by('-pub_date', '-pk').values_list('pk', flat=True)[
+            :2 * PRESET_RECIPES + 1
+        ])
+        tags = list(Tag.objects.order_by('pk')[:2])
+        ingredients = list(Ingredient.objects.order_by('pk')[:2])
+        if len(recipes) <= 2 * PRESET_RECIPES or not tags or not ingredients:
+            raise CommandError(
+                'Мало данных для замера: загрузите ингредиенты и теги '
+                '(import_csv) и создайте рецепты (generate_dataset)'
+            )
+        recipe = Recipe.objects.select_related('author').get(pk=recipes[0])
+        author = User.objects.order_by('-followers_count', 'pk').first()
+        return {
+            'recipe': recipe.pk,
+            'short_link': recipe.short_link,
+            'word': recipe.name.split()[0].strip(':'),
+            'author': author.pk,
+            'preset': recipes[1:PRESET_RECIPES + 1],
+            'batch': recipes[PRESET_RECIPES + 1:],
+            'tag': tags[0].slug,
+            'other_tag': tags[-1].slug,
+            'tag_ids': [tag.pk for tag in tags],
+            'ingredients': [ingredient.pk for ingredient in ingredients],
+            'ingredient': ingredients[0].pk,
+            'prefix': ingredients[0].name[:2],
+        }
+
+    def run(self, endpoints, options):
+        shared = self.get_shared_context()
+        barrier = threading.Barrier(options['concurrency'])
+        workers = [
+            Worker(number, shared, endpoints, options, barrier)
+            for number in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        for worker in workers:
+            if worker.error is not None:
+                raise CommandError(
+                    f'Клиент {worker.number}: {worker.error!r}'
+                ) from worker.error
+        results = {}
+        for endpoint in endpoints:
+            measured = [worker.results[endpoint.name] for worker in workers]
+            timings = [t for result in measured for t in result[0]]
+            queries = [q for result in measured for q in result[1]]
+            errors = [e for result in measured for e in result[2]]
+            # Время ответов самого занятого клиента, без setup и teardown.
+            elapsed = max(sum(result[0]) for result in measured)
+            results[endpoint.name] = (timings, queries, elapsed, errors)
+        return results
+
+    @staticmethod
+    def summarize(timings, queries, elapsed):
+        # Замеров не меньше MIN_REPEAT: это проверяет handle().
+        quantiles = statistics.quantiles(timings, n=100, method='inclusive')
+        p95, p99 = quantiles[94], quantiles[98]
+        return {
+            'p50': round(statistics.median(timings) * 1000, 3),
+            'p95': round(p95 * 1000, 3),
+            'p99': round(p99 * 1000, 3),
+            'rps': round(len(timings) / elapsed, 1),
+            'queries': max(queries) if queries else None,
+        }
+
+    def print_results(self, results):
+        self.stdout.write(
+            f'{"эндпоинт":<64} {"p50":>8} {"p95":>8} {"p99":>8} '
+            f'{"запр/с":>8} {"SQL":>4}'
+        )
+        for name, (timings, queries, elapsed, _) in results.items():
+            if not timings:
+                continue
+            summary = self.summarize(timings, queries, elapsed)
+            self.stdout.write(
+                f'{name:<64} {summary["p50"]:8.2f} {summary["p95"]:8.2f} '
+                f'{summary["p99"]:8.2f} {summary["rps"]:8.1f} '
+                f'{summary["queries"] if queries else "-":>4}'
+            )
+
+    def save(self, path, results, options):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'meta': {
+                'mode': options['mode'],
+                'concurrency': options['concurrency'],
+                'repeat': options['repeat'],
+                'database': connections['default'].vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'recipes': Recipe.objects.count(),
+                'users': User.objects.count(),
+            },
+            'endpoints': {
+                name: self.summarize(timings, queries, elapsed)
+                for name, (timings, queries, elapsed, _) in results.items()
+            },
+        }
+        path.write_text(
+            json.dumps(data, ensure_ascii=False, indent=2) + '\n',
+            encoding='utf-8'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Базовый замер: {path}'))
+
+    def compare(self, baseline, results, options):
+        threshold = options['threshold']
+        regressions = []
+        for name, (timings, queries, elapsed, _) in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            after = self.summarize(timings, queries, elapsed)
+            if after['queries'] is not None and (
+                    before['queries'] is not None) and (
+                    after['queries']
+                    > before['queries'] + options['query_threshold']):
+                regressions.append(
+                    f'{name}: SQL-запросов {before["queries"]} -> '
+                    f'{after["queries"]}'
+                )
+            for metric in LATENCY_METRICS:
+                if after[metric] > max(
+                        before[metric] * (1 + threshold),
+                        before[metric] + options['min_delta']):
+                    regressions.append(
+                        f'{name}: {metric} {before[metric]:.2f} -> '
+                        f'{after[metric]:.2f} мс'
+                    )
+            if after['rps'] < before['rps'] * (1 - threshold):
+                regressions.append(
+                    f'{name}: запр/с {before["rps"]:.1f} -> '
+                    f'{after["rps"]:.1f}'
+                )
+        return regressions
@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.pagination import KeysetPagination
+from recipes.models import Recipe
+
+URL = '/api/recipes/'
+ORDERING = ('-pub_date', '-pk')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время ответа ленты рецептов при постраничной '
+            'и курсорной пагинации на первой и глубокой странице')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=10000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        page, limit = options['page'], options['limit']
+        offset = (page - 1) * limit
+        boundary = Recipe.objects.order_by(*ORDERING)[offset - 1:offset]
+        if page > 1 and not boundary:
+            raise CommandError(
+                f'Для страницы {page} нужно больше {offset} рецептов, '
+                f'сейчас их {Recipe.objects.count()}'
+            )
+        cursor = None
+        if page > 1:
+            paginator = KeysetPagination()
+            paginator.ordering = ORDERING
+            cursor = paginator.encode_cursor(boundary[0])
+
+        client = APIClient()
+        cases = (
+            ('page', 1, {'limit': limit, 'page': 1}),
+            ('page', page, {'limit': limit, 'page': page}),
+            ('cursor', 1, {'limit': limit, 'pagination': 'cursor'}),
+            ('cursor', page, {'limit': limit, 'cursor': cursor}),
+        )
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for mode, number, params in cases:
+                if number > 1 and mode == 'cursor' and cursor is None:
+                    continue
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    response = client.get(URL, params)
+                    timings.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        raise CommandError(
+                            f'{mode} {number}: {response.status_code}'
+                        )
+                self.stdout.write(
+                    f'{mode:>6} страница {number:>6}: '
+                    f'медиана {statistics.median(timings) * 1000:.2f} мс, '
+                    f'максимум {max(timings) * 1000:.2f} мс'
+                )
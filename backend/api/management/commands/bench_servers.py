@@ -0,0 +1,181 @@
+import itertools
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import Subscription
+
+# Параметр с новым значением в каждом запросе: ключ кеша ответов
+# не повторяется, фильтры его не знают и пропускают.
+CACHE_BUST = 'nocache'
+
+SERVERS = {
+    'wsgi': [
+        sys.executable, '-m', 'gunicorn', 'foodgram_backend.wsgi',
+        '--workers', '{workers}', '--bind', '127.0.0.1:{port}',
+    ],
+    'asgi': [
+        sys.executable, '-m', 'uvicorn', 'foodgram_backend.asgi:application',
+        '--workers', '{workers}', '--port', '{port}', '--no-access-log',
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = ('Запускает проект под gunicorn (WSGI) и uvicorn (ASGI) с равным '
+            'числом воркеров и сравнивает запросы в секунду и p99 '
+            'на эндпоинтах чтения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Секунд нагрузки на каждый адрес'
+        )
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument(
+            '--servers', nargs='+', choices=SERVERS, default=list(SERVERS)
+        )
+
+    def handle(self, *args, **options):
+        if not settings.PSG:
+            self.stdout.write(self.style.WARNING(
+                'PSG=False: замер идёт на SQLite, результаты для '
+                'PostgreSQL не показательны'
+            ))
+        urls = self.get_urls()
+        for offset, name in enumerate(options['servers']):
+            port = options['port'] + offset
+            process = self.start(name, port, options['workers'])
+            try:
+                self.wait(port, process)
+                for url, headers, bust in urls:
+                    self.report(name, url, headers, bust, self.load(
+                        f'http://127.0.0.1:{port}{url}', headers, bust,
+                        options['concurrency'], options['duration']
+                    ))
+            finally:
+                process.terminate()
+                process.wait()
+
+    def get_urls(self):
+        """Адреса как (путь, заголовки, сбивать ли кеш ответов).
+
+        Анонимные ответы без сброса почти всегда берутся из кеша; сброс
+        и запросы с токеном замеряют сами представления и ORM.
+        """
+        recipe = Recipe.objects.order_by('-pk').first()
+        tag, ingredient = Tag.objects.first(), Ingredient.objects.first()
+        if recipe is None or tag is None or ingredient is None:
+            raise CommandError('Нужны хотя бы один рецепт, тег и ингредиент')
+        subscription = Subscription.objects.order_by('pk').first()
+        user = subscription.user if subscription else recipe.author
+        token, _ = Token.objects.get_or_create(user=user)
+        auth = {'Authorization': f'Token {token.key}'}
+        name = urllib.parse.quote(ingredient.name[:2])
+        return [
+            ('/api/recipes/', {}, False),
+            ('/api/recipes/', {}, True),
+            (f'/api/recipes/?tags={tag.slug}', {}, True),
+            ('/api/recipes/', auth, False),
+            (f'/api/recipes/{recipe.pk}/', {}, False),
+            (f'/api/recipes/{recipe.pk}/', auth, False),
+            ('/api/recipes/feed/', auth, False),
+            ('/api/tags/', {}, False),
+            (f'/api/tags/{tag.pk}/', {}, False),
+            (f'/api/ingredients/?name={name}', {}, False),
+            (f'/api/ingredients/{ingredient.pk}/', {}, False),
+            (f'/s/{recipe.short_link}/', {}, False),
+        ]
+
+    def start(self, name, port, workers):
+        command = [
+            part.format(workers=workers, port=port) for part in SERVERS[name]
+        ]
+        env = dict(os.environ, ALLOWED_HOSTS='127.0.0.1')
+        # asgi.py сам включает асинхронные представления, wsgi - нет.
+        env.pop('ASYNC_READ_VIEWS', None)
+        return subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def wait(self, port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Сервер завершился с кодом '
+                                   f'{process.returncode}')
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/api/tags/')
+                return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.2)
+        raise CommandError(f'Сервер на порту {port} не запустился')
+
+    def load(self, url, headers, bust, concurrency, duration):
+        deadline = time.monotonic() + duration
+        numbers = itertools.count()
+
+        def worker():
+            timings, errors = [], 0
+            opener = urllib.request.build_opener(NoRedirect)
+            while time.monotonic() < deadline:
+                request = urllib.request.Request(
+                    with_cache_bust(url, next(numbers)) if bust else url,
+                    headers=headers
+                )
+                start = time.perf_counter()
+                try:
+                    opener.open(request).read()
+                except urllib.error.HTTPError as error:
+                    if error.code >= 400:
+                        errors += 1
+                except (urllib.error.URLError, ConnectionError):
+                    errors += 1
+                timings.append(time.perf_counter() - start)
+            return timings, errors
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(
+                lambda _: worker(), range(concurrency)
+            ))
+        timings = [timing for result in results for timing in result[0]]
+        errors = sum(result[1] for result in results)
+        return timings, errors, duration
+
+    def report(self, name, url, headers, bust, result):
+        timings, errors, duration = result
+        if len(timings) < 2:
+            raise CommandError(f'{name} {url}: нет ответов')
+        p99 = statistics.quantiles(timings, n=100)[98]
+        if bust:
+            url = with_cache_bust(url, 'N')
+        label = url + (' [токен]' if headers else '')
+        self.stdout.write(
+            f'{name} {label:<40} {len(timings) / duration:8.1f} запр/с, '
+            f'p50 {statistics.median(timings) * 1000:7.2f} мс, '
+            f'p99 {p99 * 1000:7.2f} мс, ошибок {errors}'
+        )
+
+
+def with_cache_bust(url, value):
+    return f"{url}{'&' if '?' in url else '?'}{CACHE_BUST}={value}"
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Короткая ссылка отвечает 301; замеряем сам редирект.
+    def redirect_request(self, *args, **kwargs):
+        return None
@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import F
+
+from recipes.models import Recipe, Tag
+
+ORDERING = ('-pub_date', '-pk')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает фильтр рецептов по нескольким тегам через '
+            'маску tags_mask и через JOIN с таблицей тегов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tags', nargs='+',
+            help='Слаги тегов; по умолчанию первые два тега'
+        )
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        tags = Tag.objects.all()
+        if options['tags']:
+            tags = list(tags.filter(slug__in=options['tags']))
+        else:
+            tags = list(tags[:2])
+        if not tags or any(tag.bit is None for tag in tags):
+            raise CommandError('Нужны теги с назначенным битом')
+        recipes = Recipe.objects.order_by(*ORDERING)
+        cases = (
+            ('join', recipes.filter(tags__in=tags).distinct()),
+            ('mask', recipes.alias(
+                tags_match=F('tags_mask').bitand(Tag.get_mask(tags))
+            ).filter(tags_match__gt=0)),
+        )
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, теги: '
+            f'{", ".join(tag.slug for tag in tags)}'
+        )
+        pages = []
+        for name, queryset in cases:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                count = queryset.count()
+                page = list(
+                    queryset.values_list('pk', flat=True)[:options['limit']]
+                )
+                timings.append(time.perf_counter() - start)
+            pages.append((count, page))
+            self.stdout.write(
+                f'{name:>4}: найдено {count}, '
+                f'медиана {statistics.median(timings) * 1000:.2f} мс, '
+                f'максимум {max(timings) * 1000:.2f} мс'
+            )
+        if pages[0] != pages[1]:
+            raise CommandError('Результаты фильтров не совпадают')
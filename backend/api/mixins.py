@@ -0,0 +1,102 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from recipes.cache import can_store, get_version
+
+
+def get_cache_key(request, versions, vary_headers):
+    """Ключ готового ответа: версии данных, адрес, параметры, заголовки.
+
+    Принимает и HttpRequest, и запрос DRF: синхронные и асинхронные
+    представления делят одни записи кеша.
+    """
+    query = '&'.join(
+        f'{key}={value}'
+        for key, values in sorted(request.GET.lists())
+        for value in sorted(values)
+    )
+    headers = ':'.join(
+        request.META.get(header, '') for header in vary_headers
+    )
+    url = hashlib.md5(
+        f'{request.build_absolute_uri(request.path)}?{query}:{headers}'
+        .encode()
+    ).hexdigest()
+    return f'response:{":".join(versions)}:{url}'
+
+
+def make_cache_entry(body):
+    return body, quote_etag(hashlib.md5(body).hexdigest())
+
+
+def cached_http_response(request, entry, status, content_type):
+    body, etag = entry
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type=content_type)
+    response['ETag'] = etag
+    response['X-Cache'] = status
+    return response
+
+
+class VersionedCacheMixin:
+    """Отдаёт готовые JSON-ответы из кеша с сильным ETag.
+
+    Ключ кеша включает версии cache_versions, поэтому любое изменение
+    данных делает старые записи недостижимыми.
+    """
+
+    cache_versions = ()
+    cache_timeout = None
+    # Заголовки, от которых зависит тело ответа, помимо адреса запроса
+    cache_vary_headers = ('HTTP_X_PAGINATION', )
+
+    def is_cacheable(self, request):
+        # С кешем в памяти процесса смену версии увидел бы один воркер.
+        return (
+            settings.CACHE_SHARED
+            and request.accepted_renderer.format == 'json'
+        )
+
+    def get_cache_key(self, request):
+        return get_cache_key(
+            request,
+            [get_version(name) for name in self.cache_versions],
+            self.cache_vary_headers
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+        status = 'HIT'
+        if entry is None:
+            status = 'MISS'
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = make_cache_entry(request.accepted_renderer.render(
+                response.data, request.accepted_media_type,
+                self.get_renderer_context()
+            ))
+            if can_store(self.cache_versions):
+                cache.set(
+                    key, entry, self.cache_timeout or settings.CACHE_TTL
+                )
+        return cached_http_response(
+            request, entry, status, request.accepted_renderer.media_type
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -1,6 +1,166 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from functools import reduce
+from operator import attrgetter, or_
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_MODE = 'cursor'
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по курсору без OFFSET и COUNT(*).
+
+    Курсор хранит значения полей сортировки последнего объекта страницы,
+    следующая страница выбирается условием «строго после него».
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    mode_header = 'HTTP_X_PAGINATION'
+    invalid_cursor_message = 'Неверный курсор'
+
+    @classmethod
+    def is_requested(cls, request):
+        return (
+            cls.cursor_query_param in request.query_params
+            or request.query_params.get(cls.mode_query_param) == CURSOR_MODE
+            or request.META.get(cls.mode_header) == CURSOR_MODE
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets(
+            [queryset], request, view.cursor_ordering
+        )
+
+    def paginate_querysets(self, querysets, request, ordering):
+        """Одна страница из нескольких выборок с общей сортировкой.
+
+        Из каждой выборки берётся до page_size + 1 объектов после курсора,
+        затем они сливаются без повторов по pk.
+        """
+        self.request = request
+        self.ordering = ordering
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        results = {}
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.ordering)
+            if position is not None:
+                try:
+                    queryset = queryset.filter(
+                        self.get_position_filter(position)
+                    )
+                except (TypeError, ValueError, ValidationError):
+                    raise NotFound(self.invalid_cursor_message)
+            for instance in queryset[:self.page_size + 1]:
+                results.setdefault(instance.pk, instance)
+        results = list(results.values())
+        for field in reversed(self.ordering):
+            results.sort(
+                key=attrgetter(field.lstrip('-')),
+                reverse=field.startswith('-')
+            )
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_position_filter(self, position):
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = {
+                previous.lstrip('-'): value
+                for previous, value in zip(self.ordering[:index], position)
+            }
+            condition[f'{name}__{lookup}'] = position[index]
+            conditions.append(Q(**condition))
+        return reduce(or_, conditions)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or (
+                len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, instance):
+        position = [
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        ]
+        return base64.urlsafe_b64encode(
+            json.dumps(position, cls=DjangoJSONEncoder).encode()
+        ).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class CursorModeMixin:
+    """Включает KeysetPagination по ?pagination=cursor или X-Pagination.
+
+    Клиенты без этих параметров получают прежний постраничный вывод.
+    """
+
+    cursor_pagination_class = KeysetPagination
+    cursor_ordering = ('-pk',)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.pagination_class is not None and (
+                    self.cursor_pagination_class.is_requested(self.request)):
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
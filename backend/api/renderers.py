@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+from abc import ABC, abstractmethod
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListRenderer(BaseRenderer, ABC):
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Используется только для ответов с ошибками.
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def get_filename(self):
+        return f'shopping_list.{self.format}'
+
+    @abstractmethod
+    def stream(self, rows):
+        """Строки файла по строкам итогов списка покупок."""
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        for row in rows:
+            yield (
+                f'{row["ingredient__name"]} - {row["total_amount"]} '
+                f'{row["ingredient__measurement_unit"]} \n'
+            )
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            writer.writerow((
+                row['ingredient__name'],
+                row['ingredient__measurement_unit'],
+                row['total_amount'],
+            ))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = '[\n'
+        for row in rows:
+            yield separator + json.dumps({
+                'name': row['ingredient__name'],
+                'measurement_unit': row['ingredient__measurement_unit'],
+                'amount': row['total_amount'],
+            }, ensure_ascii=False)
+            separator = ',\n'
+        yield '[]\n' if separator == '[\n' else '\n]\n'
@@ -1,53 +1,114 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from foodgram_backend.constants import (MAX_BATCH_RECIPES, MAX_RECIPES_LIMIT,
+                                        MIN_VALUE)
+from foodgram_backend.metrics import TimedSerializerMixin
+from recipes.cache import RECIPES, bump_version
+from recipes.images import enqueue
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag, batch_sync)
+from recipes.search import update_search_index
 from users.models import Subscription
 
 User = get_user_model()
 
 
-class UserAvatarSerializer(DjoserUserSerializer):
-    avatar = Base64ImageField(required=True, allow_null=False)
+class RenditionField(serializers.Field):
+    """URL превью изображения, пока его нет - URL оригинала."""
+
+    def __init__(self, original, **kwargs):
+        self.original = original
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        image = (
+            getattr(obj, self.field_name) or getattr(obj, self.original)
+        )
+        if not image:
+            return None
+        request = self.context.get('request')
+        if request is None:
+            return image.url
+        return request.build_absolute_uri(image.url)
+
+
+class ImageField(Base64ImageField):
+    """Base64ImageField, не декодирующий слишком большие файлы."""
+
+    def to_internal_value(self, base64_data):
+        limit = settings.IMAGE_MAX_UPLOAD_SIZE
+        if isinstance(base64_data, str) and len(base64_data) * 3 // 4 > limit:
+            raise serializers.ValidationError(
+                f'Размер изображения не должен превышать {limit // 2 ** 20} МБ'
+            )
+        return super().to_internal_value(base64_data)
+
+
+class UserAvatarSerializer(TimedSerializerMixin, DjoserUserSerializer):
+    avatar = ImageField(required=True, allow_null=False)
 
     class Meta:
         model = User
         fields = ('avatar', )
 
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        enqueue(instance)
+        return instance
+
 
-class UserSerializer(DjoserUserSerializer):
+class UserSerializer(TimedSerializerMixin, DjoserUserSerializer):
     is_subscribed = serializers.SerializerMethodField(
         'get_subscriptions',
         read_only=True,
     )
 
+    avatar_thumbnail = RenditionField(original='avatar')
+
     class Meta:
         model = User
         fields = ['email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'avatar']
+                  'last_name', 'is_subscribed', 'avatar', 'avatar_thumbnail']
 
     def get_subscriptions(self, obj):
-        if self.context.get('request') is None:
-            return False
-        user_id = self.context.get('request').user.id
-        return Subscription.objects.filter(user=user_id, author=obj).exists()
+        return obj.id in self.get_subscribed_ids()
+
+    def get_subscribed_ids(self):
+        # Один запрос на весь ответ: контекст общий для вложенных полей.
+        context = self.context
+        if 'subscribed_ids' not in context:
+            request = context.get('request')
+            if request is None or request.user.is_anonymous:
+                context['subscribed_ids'] = set()
+            else:
+                context['subscribed_ids'] = set(
+                    Subscription.objects.filter(
+                        user=request.user
+                    ).values_list('author_id', flat=True)
+                )
+        return context['subscribed_ids']
 
 
-class IngredientsSerializer(serializers.ModelSerializer):
+class IngredientsSerializer(TimedSerializerMixin,
+                            serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
         fields = '__all__'
 
 
-class TagsSerializer(serializers.ModelSerializer):
+class TagsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'slug')
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -74,7 +135,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         queryset=Tag.objects.all(),
         required=True
     )
-    image = Base64ImageField(required=True, allow_null=False)
+    image = ImageField(required=True, allow_null=False)
 
     class Meta:
         model = Recipe
@@ -119,27 +180,114 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             )
         RecipeIngredient.objects.bulk_create(lst)
 
+    @staticmethod
+    def update_recipeingredients(recipe, ingredients_data):
+        """Приводит ингредиенты рецепта к ingredients_data.
+
+        Меняет только отличающиеся строки и возвращает разницу количеств
+        {ingredient_id: новое - старое} для списков покупок.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipeingredient_set.all()
+        }
+        new_amounts = {
+            data['id'].id: data['amount'] for data in ingredients_data
+        }
+        delta = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - (current[ingredient_id].amount
+                   if ingredient_id in current else 0)
+            )
+            for ingredient_id in current.keys() | new_amounts.keys()
+        }
+        removed = [
+            item.pk for ingredient_id, item in current.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            # Итоги списков покупок обновит общая разница ниже.
+            with batch_sync():
+                RecipeIngredient.objects.filter(pk__in=removed).delete()
+        changed = []
+        for ingredient_id, item in current.items():
+            if delta[ingredient_id] and ingredient_id in new_amounts:
+                item.amount = new_amounts[ingredient_id]
+                changed.append(item)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        created = [
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        ]
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        return {key: value for key, value in delta.items() if value}
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         self.create_recipeingredients(recipe, ingredients_data)
         recipe.tags.add(*tags_data)
+        update_search_index([recipe.pk])
+        enqueue(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         for name in ['ingredients', 'tags']:
             if validated_data.get(name) is None:
                 raise serializers.ValidationError(
                     {name: 'Это поле не может быть пустым'}
                 )
-        instance.ingredients.clear()
-        instance.tags.clear()
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
-        self.create_recipeingredients(instance, ingredients_data)
-        instance.tags.add(*tags_data)
-        return super().update(instance, validated_data)
+        old_ingredients = {
+            item.ingredient_id for item in instance.recipeingredient_set.all()
+        }
+        delta = self.update_recipeingredients(instance, ingredients_data)
+        if delta:
+            ShoppingListItem.objects.apply_delta(
+                instance.shoppingcart.values_list('user_id', flat=True),
+                delta
+            )
+        old_tags = {tag.pk for tag in instance.tags.all()}
+        new_tags = {tag.pk for tag in tags_data}
+        # Маску тегов запишет общий save() ниже.
+        with batch_sync():
+            if old_tags - new_tags:
+                instance.tags.remove(*(old_tags - new_tags))
+            if new_tags - old_tags:
+                instance.tags.add(*(new_tags - old_tags))
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        tags_mask = Tag.get_mask(tags_data)
+        if instance.tags_mask != tags_mask:
+            instance.tags_mask = tags_mask
+            changed_fields.append('tags_mask')
+        for field in changed_fields:
+            if field in validated_data:
+                setattr(instance, field, validated_data[field])
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+        elif delta:
+            # bulk_update и bulk_create не шлют сигналов, сбрасывающих кэш.
+            transaction.on_commit(lambda: bump_version(RECIPES))
+        if {'name', 'text'} & set(changed_fields) or (
+                old_ingredients != {data['id'].id
+                                    for data in ingredients_data}):
+            update_search_index([instance.pk])
+        if 'image' in changed_fields:
+            enqueue(instance)
+        return instance
 
     def to_representation(self, recipe):
         return RecipeSerializer(recipe, context=self.context).data
@@ -166,7 +314,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     tags = TagsSerializer(many=True)
     author = UserSerializer(many=False)
     ingredients = RecipeIngredientSerializer(
@@ -174,7 +322,9 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only=True,
         source='recipeingredient_set'
     )
-    image = Base64ImageField(required=False, allow_null=True)
+    image = ImageField(required=False, allow_null=True)
+    image_card = RenditionField(original='image')
+    image_detail = RenditionField(original='image')
     is_in_shopping_cart = serializers.SerializerMethodField(
         'get_shopping_cart',
         read_only=True,
@@ -188,10 +338,13 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_card',
+            'image_detail', 'text', 'cooking_time'
         )
 
     def get_favorites(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         request = self.context.get('request')
         return (
             request and request.user.is_authenticated
@@ -201,6 +354,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         request = self.context.get('request')
         return (
             request and request.user.is_authenticated
@@ -210,11 +365,13 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(TimedSerializerMixin,
+                            serializers.ModelSerializer):
+    image_card = RenditionField(original='image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_card', 'cooking_time')
 
 
 class SubscriptionCreateSerializer(serializers.ModelSerializer):
@@ -244,26 +401,39 @@ class SubscriptionSerializer(UserSerializer):
         'get_recipe',
         read_only=True,
     )
-    recipes_count = serializers.SerializerMethodField(
-        'get_recipes_count',
-        read_only=True,
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields.copy()
         fields += ['recipes', 'recipes_count']
 
+    @staticmethod
+    def get_recipes_limit(request):
+        limit = request.query_params.get('recipes_limit')
+        if limit is None:
+            return MAX_RECIPES_LIMIT
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Значение должно быть целым числом'}
+            )
+        if limit < 0:
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Значение не может быть отрицательным'}
+            )
+        return min(limit, MAX_RECIPES_LIMIT)
+
     def get_recipe(self, user):
-        limit = self.context['request'].query_params.get('recipes_limit', None)
-        recipes = Recipe.objects.filter(author=user)
-        if limit:
-            recipes = recipes[:int(limit)]
-        serializer = ShortRecipeSerializer(recipes, many=True)
+        recipes = getattr(user, 'limited_recipes', None)
+        if recipes is None:
+            limit = self.get_recipes_limit(self.context['request'])
+            recipes = user.recipes.order_by('-pub_date', '-pk')[:limit]
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context=self.context
+        )
         return serializer.data
 
-    def get_recipes_count(self, user):
-        return Recipe.objects.filter(author=user).count()
-
 
 class CreateSerializer(serializers.ModelSerializer):
 
@@ -275,6 +445,17 @@ class CreateSerializer(serializers.ModelSerializer):
         return value
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=MIN_VALUE),
+        allow_empty=False,
+        max_length=MAX_BATCH_RECIPES
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class ShoppingCartCreateSerializer(CreateSerializer):
     class Meta:
         model = ShoppingCart
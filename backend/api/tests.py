@@ -0,0 +1,823 @@
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import (AsyncRequestFactory, RequestFactory, SimpleTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.async_views import LIST_ACTIONS, AsyncReadView, load_recipes
+from api.management.commands.bench_endpoints import Command as BenchEndpoints
+from api.views import RecipeViewSet
+from foodgram_backend.db_router import (STICKY_COOKIE, PrimaryReplicaRouter,
+                                        ReplicaRoutingMiddleware)
+from foodgram_backend.sqlite.base import \
+    DatabaseWrapper as SQLiteDatabaseWrapper
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, UserRecipeManager)
+from recipes.search import update_search_index
+from users.models import Subscription
+from users.testing import create_user
+
+RECIPES = 14
+INGREDIENTS_PER_RECIPE = 3
+WRITE = re.compile(
+    r'(INSERT(?: OR IGNORE)? INTO|UPDATE|DELETE FROM) "?(\w+)"?'
+)
+FTS = 'recipes_recipe_fts'
+
+
+@override_settings(CACHE_SHARED=True)
+class RecipeTestCase(APITestCase):
+    """Читатель с токеном, авторы, теги и рецепты с ингредиентами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.authors = [create_user(f'author{number}') for number in range(3)]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(10)
+        )
+        for number in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % len(cls.authors)],
+                name=f'Рецепт {number}', text='Описание', cooking_time=10
+            )
+            recipe.tags.add(*cls.tags[:number % len(cls.tags) + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, amount=number + 1,
+                    ingredient=ingredients[
+                        (number + offset) % len(ingredients)
+                    ]
+                )
+                for offset in range(INGREDIENTS_PER_RECIPE)
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.recipe = Recipe.objects.order_by('pk').first()
+        update_search_index(Recipe.objects.values_list('pk', flat=True))
+        for author in cls.authors:
+            Subscription.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        # Анонимные ответы кешируются: каждый тест начинает с промаха.
+        cache.clear()
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeQueryCountTests(RecipeTestCase):
+    """Число SQL-запросов не растёт с числом рецептов на странице."""
+
+    def assert_list_queries(self, queries):
+        for limit in (2, 6, 12):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_list_anonymous(self):
+        # COUNT, рецепты с авторами, строки ингредиентов, ингредиенты,
+        # теги; с токеном добавляются сам токен и id подписок.
+        self.assert_list_queries(5)
+
+    def test_list_authenticated(self):
+        self.authenticate()
+        self.assert_list_queries(7)
+
+    def test_retrieve_anonymous(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_retrieve_authenticated(self):
+        self.authenticate()
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+    def test_counter_ordering_not_cached(self):
+        # Пакетные добавления не сбрасывают кэш рецептов.
+        orderings = ('-favorites_count', '-in_carts_count')
+        for ordering in orderings:
+            self.client.get('/api/recipes/', {'ordering': ordering})
+        for author in self.authors:
+            Favorite.objects.add_recipes(author.pk, [self.recipe.pk])
+            ShoppingCart.objects.add_recipes(author.pk, [self.recipe.pk])
+        for ordering in orderings:
+            with self.subTest(ordering=ordering):
+                response = self.client.get(
+                    '/api/recipes/', {'ordering': ordering}
+                )
+                self.assertEqual(
+                    response.json()['results'][0]['id'], self.recipe.pk
+                )
+
+    def test_subscriptions(self):
+        self.authenticate()
+        for limit in (1, 3):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(5):
+                    response = self.client.get(
+                        '/api/users/subscriptions/', {'limit': limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_subscription_recipe_urls(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image='recipes/image.jpg'
+        )
+        self.authenticate()
+        response = self.client.get('/api/users/subscriptions/')
+        recipe = next(
+            recipe
+            for author in response.json()['results']
+            for recipe in author['recipes']
+            if recipe['id'] == self.recipe.pk
+        )
+        self.assertEqual(
+            recipe['image_card'], 'http://testserver/media/recipes/image.jpg'
+        )
+
+
+class ResponseCacheTests(RecipeTestCase):
+    """Кеш анонимных ответов и его сброс."""
+
+    def get(self):
+        return self.client.get('/api/recipes/').get('X-Cache')
+
+    def test_hit(self):
+        self.assertEqual([self.get(), self.get()], ['MISS', 'HIT'])
+
+    @override_settings(CACHE_SHARED=False)
+    def test_not_shared(self):
+        # Кеш в памяти процесса: версии в других воркерах не сменятся.
+        self.assertEqual([self.get(), self.get()], [None, None])
+
+    def test_signup_keeps_cache(self):
+        self.get()
+        create_user('newcomer')
+        self.assertEqual(self.get(), 'HIT')
+
+    def test_author_change_resets_cache(self):
+        self.get()
+        self.authors[0].first_name = 'Другое'
+        self.authors[0].save()
+        self.assertEqual(self.get(), 'MISS')
+
+
+class AddRecipeLockTests(RecipeTestCase):
+    """Одиночное добавление берёт ту же блокировку, что и пакетное."""
+
+    def test_single_add_locks_user(self):
+        self.authenticate()
+        recipe = Recipe.objects.order_by('pk').last()
+        for action in ('favorite', 'shopping_cart'):
+            with self.subTest(action=action), mock.patch.object(
+                    UserRecipeManager, 'lock_user',
+                    wraps=UserRecipeManager.lock_user) as lock_user:
+                Favorite.objects.filter(recipe=recipe).delete()
+                ShoppingCart.objects.filter(recipe=recipe).delete()
+                response = self.client.post(
+                    f'/api/recipes/{recipe.pk}/{action}/'
+                )
+                self.assertEqual(response.status_code, 201)
+                lock_user.assert_called_once_with(self.user.pk)
+
+    def test_batch_after_single_add(self):
+        self.authenticate()
+        ids = list(Recipe.objects.values_list('pk', flat=True)[:3])
+        self.client.post(f'/api/recipes/{ids[0]}/favorite/')
+        response = self.client.post(
+            '/api/recipes/favorite/', {'recipes': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            Recipe.objects.get(pk=ids[0]).favorites_count,
+            Favorite.objects.filter(recipe_id=ids[0]).count()
+        )
+
+
+class ShoppingListDownloadTests(RecipeTestCase):
+    """Файл списка покупок в трёх форматах и 304 на повторную загрузку."""
+
+    URL = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate()
+        self.totals = {
+            (item.ingredient.name, item.ingredient.measurement_unit):
+                item.amount
+            for item in ShoppingListItem.objects.filter(
+                user=self.user
+            ).select_related('ingredient')
+        }
+
+    def download(self, file_format, **headers):
+        return self.client.get(self.URL, {'format': file_format}, **headers)
+
+    def test_txt(self):
+        response = self.download('txt')
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="shopping_list.txt"'
+        )
+        lines = response.content.decode().splitlines()
+        self.assertEqual(sorted(lines), sorted(
+            f'{name} - {amount} {unit} '
+            for (name, unit), amount in self.totals.items()
+        ))
+
+    def test_csv(self):
+        response = self.download('csv')
+        header, *rows = csv.reader(io.StringIO(response.content.decode()))
+        self.assertEqual(header, ['name', 'measurement_unit', 'amount'])
+        self.assertEqual(
+            {(name, unit): int(amount) for name, unit, amount in rows},
+            self.totals
+        )
+
+    def test_json(self):
+        response = self.download('json')
+        self.assertEqual(int(response['Content-Length']),
+                         len(response.content))
+        self.assertEqual({
+            (row['name'], row['measurement_unit']): row['amount']
+            for row in json.loads(response.content)
+        }, self.totals)
+
+    def test_not_modified(self):
+        etag = self.download('json')['ETag']
+        response = self.download('json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        ShoppingCart.objects.filter(user=self.user).delete()
+        response = self.download('json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [])
+
+
+class IngredientSearchTests(APITestCase):
+    """Автодополнение: полное совпадение, начало названия, начало слова."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in (
+                'Соль морская', 'Морская капуста', 'соль', 'Сода',
+                'Перец', 'Соленья', 'Капуста морская'
+            )
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.json()]
+
+    def test_exact_first(self):
+        self.assertEqual(self.search('СОЛЬ'), ['соль', 'Соль морская'])
+
+    def test_prefix_before_word(self):
+        self.assertEqual(
+            self.search('мор'), ['Морская капуста', 'Капуста морская',
+                                 'Соль морская']
+        )
+
+    def test_limit(self):
+        with override_settings(INGREDIENT_SEARCH_LIMIT=2):
+            self.assertEqual(self.search('со'), ['Сода', 'Соленья'])
+
+
+@override_settings(CACHE_SHARED=True)
+class CatalogCacheTests(APITestCase):
+    """Справочники отдаются из кеша с ETag и сбрасываются при изменении."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        for url in ('/api/tags/', '/api/ingredients/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                etag = response['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['X-Cache'], 'HIT')
+                self.assertEqual(response['ETag'], etag)
+
+    def test_tag_change(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        Tag.objects.create(name='Обед', slug='lunch')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(
+            [tag['slug'] for tag in response.json()], ['breakfast', 'lunch']
+        )
+
+    def test_ingredient_change(self):
+        url = '/api/ingredients/'
+        etag = self.client.get(url, {'name': 'со'})['ETag']
+        self.ingredient.name = 'Сахар'
+        self.ingredient.save()
+        response = self.client.get(
+            url, {'name': 'са'}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual([row['name'] for row in response.json()], ['Сахар'])
+        response = self.client.get(
+            url, {'name': 'со'}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+
+class TagsFilterTests(RecipeTestCase):
+    """Фильтр по маске тегов находит те же рецепты, что и JOIN по тегам."""
+
+    def filtered_ids(self, tags):
+        cache.clear()
+        response = self.client.get(
+            '/api/recipes/', {'tags': [tag.slug for tag in tags], 'limit': 50}
+        )
+        return sorted(recipe['id'] for recipe in response.json()['results'])
+
+    def joined_ids(self, tags):
+        return sorted(Recipe.objects.filter(
+            tags__in=tags
+        ).distinct().values_list('pk', flat=True))
+
+    def assert_same(self):
+        for count in range(1, len(self.tags) + 1):
+            for tags in itertools.combinations(self.tags, count):
+                with self.subTest(tags=[tag.slug for tag in tags]):
+                    self.assertEqual(
+                        self.filtered_ids(tags), self.joined_ids(tags)
+                    )
+
+    def test_mask(self):
+        self.assertTrue(all(tag.bit is not None for tag in self.tags))
+        self.assert_same()
+
+    def test_tags_changed(self):
+        self.recipe.tags.set(self.tags[1:])
+        self.tags[1].recipes.add(
+            *Recipe.objects.exclude(tags=self.tags[1])[:3]
+        )
+        self.tags[2].recipes.remove(
+            *Recipe.objects.filter(tags=self.tags[2])[:2]
+        )
+        self.assert_same()
+
+    def test_tag_without_bit(self):
+        Tag.objects.filter(pk=self.tags[1].pk).update(bit=None)
+        self.tags[1].refresh_from_db()
+        self.assert_same()
+
+
+class CursorPaginationTests(RecipeTestCase):
+    """Курсор идёт в порядке фильтра: по счётчику и по рангу поиска."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Самый старый рецепт - самый популярный: по дате он был бы последним.
+        for author in cls.authors:
+            Favorite.objects.create(user=author, recipe=cls.recipe)
+            ShoppingCart.objects.create(user=author, recipe=cls.recipe)
+
+    def walk(self, params):
+        ids, params = [], {**params, 'pagination': 'cursor', 'limit': 4}
+        while True:
+            response = self.client.get('/api/recipes/', params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids += [recipe['id'] for recipe in data['results']]
+            if data['next'] is None:
+                return ids
+            params['cursor'] = parse_qs(urlparse(data['next']).query)[
+                'cursor'
+            ][0]
+
+    def pages(self, params):
+        response = self.client.get('/api/recipes/', {**params, 'limit': 100})
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_same_order_as_pages(self):
+        for params in (
+            {}, {'ordering': '-favorites_count'},
+            {'ordering': 'in_carts_count'}, {'ordering': 'pub_date'},
+            {'ordering': '-favorites_count', 'tags': 'tag1'},
+            {'search': 'ингредиент 3'}, {'search': 'рецепт', 'tags': 'tag1'},
+            {'search': 'ингредиент', 'ordering': '-in_carts_count'},
+        ):
+            with self.subTest(params=params):
+                expected = self.pages(params)
+                self.assertTrue(expected)
+                self.assertEqual(self.walk(params), expected)
+
+    def test_counter_ordering(self):
+        for ordering in ('-favorites_count', '-in_carts_count'):
+            with self.subTest(ordering=ordering):
+                self.assertEqual(
+                    self.walk({'ordering': ordering})[0], self.recipe.pk
+                )
+
+    def test_search_rank(self):
+        # Совпадение и в названии, и в ингредиентах выше более новых.
+        best = Recipe.objects.get(name='Рецепт 3')
+        self.assertEqual(self.walk({'search': 'ингредиент 3'})[0], best.pk)
+
+
+class AsyncRecipeListTests(RecipeTestCase):
+    """Асинхронный список рецептов отдаёт то же, что синхронный."""
+
+    view = AsyncReadView(
+        RecipeViewSet, LIST_ACTIONS, False, 'recipes', load_recipes
+    )
+
+    def get_async(self, params):
+        cache.clear()
+        request = AsyncRequestFactory().get('/api/recipes/', params)
+        response = async_to_sync(self.view.dispatch)(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response, json.loads(response.content)
+
+    def get_sync(self, params):
+        cache.clear()
+        response = self.client.get('/api/recipes/', params)
+        return response, json.loads(response.content)
+
+    def test_same_as_sync(self):
+        for params in (
+            {}, {'limit': 4, 'page': 2}, {'limit': 5, 'page': 3},
+            {'tags': ['tag0', 'tag2'], 'page': 2},
+            {'author': self.authors[1].pk, 'limit': 2, 'page': 2},
+            {'search': 'рецепт', 'limit': 3},
+            {'ordering': 'pub_date', 'is_favorited': 1},
+        ):
+            with self.subTest(params=params), mock.patch.object(
+                    self.view, 'sync_view', side_effect=AssertionError):
+                response, data = self.get_async(params)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertEqual(data, self.get_sync(params)[1])
+
+    def test_fallback_to_sync(self):
+        for params in (
+            {'page': 99}, {'page': 0}, {'tags': 'missing'},
+            {'pagination': 'cursor'}, {'ordering': '-favorites_count'},
+        ):
+            with self.subTest(params=params):
+                response, data = self.get_async(params)
+                expected, expected_data = self.get_sync(params)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(data, expected_data)
+
+
+class RecipeUpdateWritesTests(APITestCase):
+    """Правка рецепта пишет в базу только то, что изменилось."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание', cooking_time=10
+        )
+        cls.recipe.tags.add(cls.tags[0])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=cls.recipe, ingredient=ingredient, amount=5
+            )
+            for ingredient in cls.ingredients[:2]
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+        self.data = {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'tags': [self.tags[0].pk],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 5}
+                for ingredient in self.ingredients[:2]
+            ],
+        }
+
+    def assert_writes(self, expected):
+        """Сверяет записи PATCH в виде (оператор, таблица), отдаёт их SQL."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/', self.data, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        writes = [
+            (WRITE.match(query['sql']), query['sql'])
+            for query in context.captured_queries
+        ]
+        writes = [
+            ((match[1].split()[0], match[2]), sql)
+            for match, sql in writes if match
+        ]
+        self.assertEqual(
+            [write for write, _ in writes], expected,
+            [sql for _, sql in writes]
+        )
+        return [sql for _, sql in writes]
+
+    def test_no_changes(self):
+        self.assert_writes([])
+
+    def test_name(self):
+        self.data['name'] = 'Новое название'
+        update, *_ = self.assert_writes([
+            ('UPDATE', 'recipes_recipe'), ('DELETE', FTS), ('INSERT', FTS),
+        ])
+        self.assertIn('SET "name" = ', update)
+        self.assertNotIn('"text"', update)
+
+    def test_amount(self):
+        self.data['ingredients'][0]['amount'] = 7
+        self.data['ingredients'][1]['amount'] = 9
+        update, = self.assert_writes([
+            ('UPDATE', 'recipes_recipeingredient'),
+        ])
+        self.assertIn('CASE', update)
+
+    def test_swap_ingredient(self):
+        self.data['ingredients'][1]['id'] = self.ingredients[2].pk
+        self.assert_writes([
+            ('DELETE', 'recipes_recipeingredient'),
+            ('INSERT', 'recipes_recipeingredient'),
+            ('DELETE', FTS), ('INSERT', FTS),
+        ])
+
+    def test_tags(self):
+        self.data['tags'] = [self.tags[1].pk]
+        update = self.assert_writes([
+            ('DELETE', 'recipes_recipe_tags'),
+            ('INSERT', 'recipes_recipe_tags'),
+            ('UPDATE', 'recipes_recipe'),
+        ])[-1]
+        self.assertIn('SET "tags_mask" = ', update)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tags_mask, Tag.get_mask([self.tags[1]]))
+
+
+@override_settings(FEED_FANOUT_LIMIT=2, FEED_MAX_ITEMS=3, FEED_BACKFILL=2)
+class FeedTests(APITestCase):
+    """Ленты без пропусков и повторов при переходе через FEED_FANOUT_LIMIT."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.followers = [
+            create_user(f'follower{number}') for number in range(3)
+        ]
+        for follower in cls.followers[:2]:
+            Subscription.objects.create(user=follower, author=cls.author)
+
+    def publish(self, count=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes = [
+                Recipe.objects.create(
+                    author=self.author, name=f'Рецепт {number}',
+                    text='Описание', cooking_time=10
+                )
+                for number in range(count)
+            ]
+        return [recipe.pk for recipe in recipes]
+
+    def feed_ids(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/recipes/feed/', {'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def stored_ids(self, user):
+        return sorted(FeedItem.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        ))
+
+    def test_fan_out_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Recipe.objects.create(
+                author=self.author, name='Рецепт', text='Описание',
+                cooking_time=10
+            )
+        self.assertFalse(FeedItem.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(FeedItem.objects.count(), 2)
+
+    def test_timeline_capped(self):
+        ids = self.publish(5)
+        self.assertEqual(self.stored_ids(self.followers[0]), ids[-3:])
+
+    def test_crossing_up(self):
+        ids = self.publish(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.create(
+                user=self.followers[2], author=self.author
+            )
+        self.assertFalse(FeedItem.objects.filter(author=self.author).exists())
+        for follower in self.followers:
+            self.assertEqual(sorted(self.feed_ids(follower)), ids)
+
+    def test_crossing_down(self):
+        Subscription.objects.create(user=self.followers[2], author=self.author)
+        ids = self.publish(3)
+        self.assertFalse(FeedItem.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(user=self.followers[2]).delete()
+        for follower in self.followers[:2]:
+            self.assertEqual(self.stored_ids(follower), ids[-2:])
+            self.assertEqual(sorted(self.feed_ids(follower)), ids[-2:])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRouterTests(SimpleTestCase):
+    """После записи клиент читает из основной базы, остальные - с реплики."""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(self.view)
+
+    def view(self, request):
+        self.read_db = PrimaryReplicaRouter().db_for_read(Recipe)
+        return HttpResponse(status=request.META.get('STATUS', 200))
+
+    def request(self, method, cookies=None, **extra):
+        request = getattr(self.factory, method)('/api/recipes/', **extra)
+        request.COOKIES.update(cookies or {})
+        response = self.middleware(request)
+        return self.read_db, response
+
+    def test_read_from_replica(self):
+        self.assertEqual(self.request('get')[0], 'replica_0')
+        self.assertEqual(
+            PrimaryReplicaRouter().db_for_read(Recipe), 'default'
+        )
+
+    def test_write_sticks_cookie(self):
+        read_db, response = self.request('post')
+        self.assertEqual(read_db, 'default')
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+        read_db, _ = self.request('get', {STICKY_COOKIE: cookie.value})
+        self.assertEqual(read_db, 'default')
+        self.assertEqual(self.request('get')[0], 'replica_0')
+
+    def test_write_sticks_token(self):
+        self.request('delete', HTTP_AUTHORIZATION='Token writer')
+        self.assertEqual(
+            self.request('get', HTTP_AUTHORIZATION='Token writer')[0],
+            'default'
+        )
+        self.assertEqual(
+            self.request('get', HTTP_AUTHORIZATION='Token reader')[0],
+            'replica_0'
+        )
+
+    def test_failed_write_not_sticky(self):
+        _, response = self.request(
+            'post', HTTP_AUTHORIZATION='Token writer', STATUS=400
+        )
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(
+            self.request('get', HTTP_AUTHORIZATION='Token writer')[0],
+            'replica_0'
+        )
+
+    def test_async(self):
+        async def view(request):
+            return self.view(request)
+
+        middleware = ReplicaRoutingMiddleware(view)
+        factory = AsyncRequestFactory()
+        for method, read_db in (('get', 'replica_0'), ('post', 'default'),
+                                ('get', 'default')):
+            with self.subTest(method=method):
+                async_to_sync(middleware)(getattr(factory, method)(
+                    '/api/recipes/', headers={'Authorization': 'Token writer'}
+                ))
+                self.assertEqual(self.read_db, read_db)
+
+
+class SQLiteConnectionTests(SimpleTestCase):
+    """Подключение SQLite получает PRAGMA и BEGIN IMMEDIATE из OPTIONS."""
+
+    ALIAS = 'sqlite_options'
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Проверяются настройки SQLite')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'db.sqlite3')
+        options = settings.DATABASES_SQL['default']['OPTIONS']
+        connections[self.ALIAS] = SQLiteDatabaseWrapper({
+            **connection.settings_dict, 'NAME': self.path,
+            'OPTIONS': options,
+        }, self.ALIAS)
+        self.addCleanup(connections.__delitem__, self.ALIAS)
+        self.addCleanup(connections[self.ALIAS].close)
+
+    def pragma(self, name):
+        with connections[self.ALIAS].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('temp_store'), 2)
+        pragmas = settings.DATABASES_SQL['default']['OPTIONS']['pragmas']
+        for name in ('busy_timeout', 'cache_size'):
+            with self.subTest(name=name):
+                self.assertEqual(self.pragma(name), pragmas[name])
+
+    def test_immediate_transaction(self):
+        self.pragma('user_version')
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using=self.ALIAS):
+            # Блокировка записи берётся до первой записи в транзакции.
+            with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+                other.execute('BEGIN IMMEDIATE')
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+
+
+class BenchSummaryTests(SimpleTestCase):
+    """Сводка замера считается и при наименьшем числе повторов."""
+
+    def test_min_repeat(self):
+        summary = BenchEndpoints.summarize([0.002, 0.004], [3, 3], 0.01)
+        self.assertEqual(summary['p50'], 3.0)
+        self.assertEqual(summary['p99'], 3.98)
+        self.assertEqual(summary['queries'], 3)
+
+    def test_quantiles(self):
+        timings = [number / 1000 for number in range(1, 101)]
+        summary = BenchEndpoints.summarize(timings, [], 1.0)
+        self.assertEqual(summary['p95'], 95.05)
+        self.assertIsNone(summary['queries'])
+
+    def test_repeat_too_small(self):
+        with self.assertRaises(CommandError):
+            call_command('bench_endpoints', repeat=1)
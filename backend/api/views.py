@@ -1,6 +1,12 @@
-from django.db.models import Count, Sum
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Value
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import generics, permissions, status, viewsets
 from rest_framework.decorators import action
@@ -9,22 +15,50 @@ from rest_framework.permissions import (AllowAny, IsAuthenticated,
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.filters import IngredientsFilter, RecipeFilter
-from api.pagination import CustomPageNumberPagination
+from api.filters import (COUNTER_ORDERING_FIELDS, IngredientsFilter,
+                         RecipeFilter, get_recipe_ordering)
+from api.mixins import VersionedCacheMixin
+from api.pagination import (CursorModeMixin, CustomPageNumberPagination,
+                            KeysetPagination)
 from api.permissions import IsSuperUserOrOwnerOrReadOnly
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                           ShoppingListTextRenderer)
 from api.serializers import (FavoriteCreateSerializer, IngredientsSerializer,
-                             RecipeCreateSerializer, RecipeSerializer,
-                             ShoppingCartCreateSerializer,
+                             RecipeCreateSerializer, RecipeIdsSerializer,
+                             RecipeSerializer, ShoppingCartCreateSerializer,
                              ShortRecipeSerializer,
                              SubscriptionCreateSerializer,
                              SubscriptionSerializer, TagsSerializer,
                              UserAvatarSerializer)
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.cache import CATALOG, RECIPES
+from recipes.indexes import ingredient_index
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
 from users.models import MyUser as User
 from users.models import Subscription
 
+FEED_ORDERING = ('-feed_date', '-pk')
+
+
+def annotate_user_flags(queryset, user):
+    """Добавляет рецептам is_favorited и is_in_shopping_cart для user."""
+    if user.is_anonymous:
+        return queryset.annotate(
+            is_favorited=Value(False),
+            is_in_shopping_cart=Value(False)
+        )
+    return queryset.annotate(
+        is_favorited=Exists(Favorite.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )),
+        is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+    )
+
 
-class UserViewSet(DjoserUserViewSet):
+class UserViewSet(CursorModeMixin, DjoserUserViewSet):
+    cursor_ordering = ('username', 'pk')
 
     def get_serializer_class(self):
         if self.action == "subscriptions":
@@ -33,10 +67,15 @@ class UserViewSet(DjoserUserViewSet):
 
     @action(["get"], detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request, *args, **kwargs):
+        limit = SubscriptionSerializer.get_recipes_limit(request)
         qs = User.objects.filter(followers__user=request.user)
-        queryset = self.filter_queryset(qs).annotate(
-            recipes_count=Count('recipes')
-        )
+        queryset = self.filter_queryset(qs).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.order_by('-pub_date', '-pk')[:limit],
+                to_attr='limited_recipes'
+            )
+        ).order_by('username')
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -47,6 +86,7 @@ class UserViewSet(DjoserUserViewSet):
 
 
 class IngredientsListRetrieve(
+    VersionedCacheMixin,
     generics.ListAPIView,
     generics.RetrieveAPIView,
     viewsets.GenericViewSet
@@ -56,9 +96,20 @@ class IngredientsListRetrieve(
     permission_classes = (IsAuthenticatedOrReadOnly, )
     filterset_class = IngredientsFilter
     pagination_class = None
+    cache_versions = (CATALOG, )
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.search, request)
+
+    def search(self, request):
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''),
+            settings.INGREDIENT_SEARCH_LIMIT
+        ))
 
 
 class TagsListRetrieve(
+    VersionedCacheMixin,
     generics.ListAPIView,
     generics.RetrieveAPIView,
     viewsets.GenericViewSet
@@ -67,6 +118,7 @@ class TagsListRetrieve(
     serializer_class = TagsSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
     pagination_class = None
+    cache_versions = (CATALOG, )
 
 
 class UserAvatarViewSet(APIView):
@@ -81,7 +133,9 @@ class UserAvatarViewSet(APIView):
 
     def delete(self, request):
         username = request.user.username
-        User.objects.filter(username=username).update(avatar=None)
+        User.objects.filter(username=username).update(
+            avatar=None, avatar_thumbnail=None
+        )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -110,9 +164,10 @@ class SubscribeViewSet(APIView):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CursorModeMixin, VersionedCacheMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all().prefetch_related(
-        'ingredients', 'tags'
+        'recipeingredient_set__ingredient', 'tags'
     ).select_related(
         'author'
     ).order_by('-pub_date', '-pk')
@@ -122,7 +177,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
     pagination_class = CustomPageNumberPagination
     filterset_class = RecipeFilter
     filterset_fields = (
-        'author', 'tags', 'is_in_shopping_cart', 'is_favorited')
+        'author', 'tags', 'is_in_shopping_cart', 'is_favorited', 'search',
+        'ordering')
+    cache_versions = (CATALOG, RECIPES)
+
+    @property
+    def cache_timeout(self):
+        return settings.RECIPE_CACHE_TTL
+
+    @property
+    def cursor_ordering(self):
+        # Курсор идёт по той же сортировке, что задал фильтр: по счётчику
+        # или по рангу поиска, а не всегда по дате.
+        return get_recipe_ordering(self.request.query_params)
+
+    def is_cacheable(self, request):
+        ordering = request.query_params.get('ordering', '').lstrip('-')
+        return (
+            request.user.is_anonymous
+            and ordering not in COUNTER_ORDERING_FIELDS
+            and super().is_cacheable(request)
+        )
+
+    def get_queryset(self):
+        return annotate_user_flags(super().get_queryset(), self.request.user)
 
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -146,8 +224,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         request.data['user'] = request.user.id
         serializer = serializer_class(
             data=request.data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            # Та же блокировка, что у пакетного add_recipes: проверка
+            # повтора и вставка не пересекаются с пакетом.
+            serializer_class.Meta.model.objects.lock_user(request.user.id)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         return serializer.instance.recipe
 
     @staticmethod
@@ -159,6 +241,39 @@ class RecipeViewSet(viewsets.ModelViewSet):
         except model_class.DoesNotExist:
             return status.HTTP_400_BAD_REQUEST
 
+    @staticmethod
+    def add_recipes(model_class, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        found = set(
+            Recipe.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+        added = set(model_class.objects.add_recipes(
+            request.user.id, [pk for pk in ids if pk in found]
+        ))
+        return Response([
+            {
+                'id': pk,
+                'status': (
+                    'added' if pk in added
+                    else 'exists' if pk in found else 'not_found'
+                )
+            }
+            for pk in ids
+        ])
+
+    @staticmethod
+    def delete_recipes(model_class, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        removed = set(model_class.objects.remove_recipes(request.user.id, ids))
+        return Response([
+            {'id': pk, 'status': 'removed' if pk in removed else 'missing'}
+            for pk in ids
+        ])
+
     @action(detail=True, methods=['post'])
     def shopping_cart(self, request, pk=None):
         recipe = self.add_recipe(ShoppingCartCreateSerializer, request, pk)
@@ -172,24 +287,49 @@ class RecipeViewSet(viewsets.ModelViewSet):
         status = self.delete_recipe(ShoppingCart, request, pk)
         return Response(status=status)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['post'], url_path='shopping_cart',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return self.add_recipes(ShoppingCart, request)
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return self.delete_recipes(ShoppingCart, request)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[ShoppingListTextRenderer,
+                              ShoppingListCSVRenderer,
+                              ShoppingListJSONRenderer])
     def download_shopping_cart(self, request, pk=None):
-        user = request.user
-        ingredients = Ingredient.objects.prefetch_related(
-            'recipes', 'recipes__shoppingcart'
-        ).filter(
-            recipes__shoppingcart__user=user
+        """Файл списка покупок из готовых итогов ShoppingListItem.
+
+        Тело собирается целиком до отправки: по нему считается ETag,
+        чтобы отвечать 304 на повторную загрузку. Строк в нём столько,
+        сколько разных ингредиентов в корзине пользователя.
+        """
+        rows = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit'
         ).annotate(
-            total_amount=Sum('recipeingredient__amount')
+            total_amount=F('amount')
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
+        renderer = request.accepted_renderer
+        content = ''.join(renderer.stream(rows)).encode(renderer.charset)
+        etag = quote_etag(hashlib.md5(content).hexdigest())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = HttpResponse(
+            content,
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
         )
-        if ingredients.exists():
-            response = HttpResponse(content_type='text/plain')
-            response['Content-Disposition'] = 'attachment; filename="file.txt"'
-            for ingredient in ingredients:
-                response.write(
-                    f'{ingredient.name} - {ingredient.total_amount} '
-                    f'{ingredient.measurement_unit} \n'
-                )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{renderer.get_filename()}"'
+        )
+        response['Content-Length'] = len(content)
+        response['ETag'] = etag
         return response
 
     @action(detail=True, methods=['post'])
@@ -205,6 +345,38 @@ class RecipeViewSet(viewsets.ModelViewSet):
         status = self.delete_recipe(Favorite, request, pk)
         return Response(status=status)
 
+    @action(detail=False, methods=['post'], url_path='favorite',
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        return self.add_recipes(Favorite, request)
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return self.delete_recipes(Favorite, request)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        user = request.user
+        queryset = self.get_queryset()
+        # Лента, разложенная при публикации, и рецепты авторов с большим
+        # числом подписчиков, которые в ленты не раскладываются.
+        pushed = queryset.filter(feed_items__user=user).exclude(
+            # Записи автора, перешедшего к чтению при запросе, удаляются
+            # после коммита: до этого они не должны дублировать pulled.
+            author__followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).annotate(feed_date=F('feed_items__pub_date'))
+        pulled = queryset.filter(author__in=User.objects.filter(
+            followers__user=user,
+            followers_count__gt=settings.FEED_FANOUT_LIMIT
+        )).annotate(feed_date=F('pub_date'))
+        paginator = KeysetPagination()
+        page = paginator.paginate_querysets(
+            [pushed, pulled], request, FEED_ORDERING
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['get'], permission_classes=[AllowAny],
             url_path='get-link', url_name='get-link')
     def get_link(self, request, pk=None):
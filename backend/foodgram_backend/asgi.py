@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True')
+# Django не рекомендует постоянные подключения в асинхронном режиме.
+os.environ.setdefault('CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -1,6 +1,27 @@
 MAX_NAME = 150
 MAX_OUT_NAME = 20
 MAX_EMAIL = 254
-MAX_SHORT_LINK = 3
+MAX_SHORT_LINK = 16
+SHORT_LINK_ALPHABET = (
+    '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+)
+# Старые ссылки короче: 3 символа, затем base62(pk + 62^3) на 4-5.
+SHORT_LINK_LENGTH = 6
 MIN_VALUE = 1
+# Биты знакового BIGINT, доступные для маски тегов рецепта
+MAX_TAG_BITS = 63
+MAX_RECIPES_LIMIT = 100
+# Рецептов в одном пакетном запросе к избранному и списку покупок
+MAX_BATCH_RECIPES = 100
+# Подписчиков в одной пачке записи лент
+FEED_FANOUT_BATCH = 1000
 ME = 'me'
+# С какого числа строк админка показывает оценку вместо COUNT(*)
+ESTIMATED_COUNT_FROM = 100000
+# Размеры превью: ширина, высота, обрезать ли до точного размера
+IMAGE_RENDITIONS = {
+    'card': (480, 320, True),
+    'detail': (1280, 960, False),
+    'avatar': (160, 160, True),
+    'original': (2048, 2048, False),
+}
@@ -0,0 +1,103 @@
+"""Чтение с реплик, запись в основную базу.
+
+Реплики из settings.DATABASE_REPLICAS используются только для запросов
+безопасными методами, которые пришли через ReplicaRoutingMiddleware.
+Команды, фоновые задачи и всё, что идёт вне запроса, работают
+с основной базой. После успешной записи клиент на
+REPLICA_STICKY_SECONDS читает из основной базы, чтобы видеть свои
+изменения: браузер - по cookie, клиенты с токеном - по записи в кеше.
+"""
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'use_primary'
+
+_read_db = ContextVar('read_db', default=None)
+
+
+def reads_from_replica():
+    return _read_db.get() is not None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_db.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+
+def get_sticky_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return 'use_primary:' + hashlib.md5(authorization.encode()).hexdigest()
+
+
+def is_sticky(request):
+    if STICKY_COOKIE in request.COOKIES:
+        return True
+    key = get_sticky_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+def choose_read_db(request):
+    if (request.method not in SAFE_METHODS
+            or not settings.DATABASE_REPLICAS or is_sticky(request)):
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def stick_to_primary(request, response):
+    if request.method in SAFE_METHODS or response.status_code >= 400:
+        return
+    timeout = settings.REPLICA_STICKY_SECONDS
+    response.set_cookie(
+        STICKY_COOKIE, '1', max_age=timeout, httponly=True, samesite='Lax'
+    )
+    key = get_sticky_key(request)
+    if key is not None:
+        cache.set(key, True, timeout)
+
+
+class ReplicaRoutingMiddleware:
+    """Выбирает одну реплику на весь запрос или основную базу."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_db.set(choose_read_db(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_db.reset(token)
+        stick_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = _read_db.set(choose_read_db(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_db.reset(token)
+        stick_to_primary(request, response)
+        return response
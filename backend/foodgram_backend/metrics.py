@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    METRICS = (
+        ('foodgram_request_duration_seconds',
+         'Полное время обработки запроса', LATENCY_BUCKETS),
+        ('foodgram_sql_duration_seconds',
+         'Время выполнения SQL-запросов', LATENCY_BUCKETS),
+        ('foodgram_serializer_duration_seconds',
+         'Время сериализации ответа', LATENCY_BUCKETS),
+        ('foodgram_sql_queries',
+         'Количество SQL-запросов', QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, endpoint, stats, duration):
+        values = (
+            duration, stats.sql_time, stats.serializer_time, stats.queries
+        )
+        with self.lock:
+            for (name, _, buckets), value in zip(self.METRICS, values):
+                key = (name, endpoint)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(buckets)
+                self.histograms[key].observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, description, _ in self.METRICS:
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, endpoint), histogram in sorted(
+                        self.histograms.items()):
+                    if metric != name:
+                        continue
+                    label = f'endpoint="{endpoint}"'
+                    for bound, count in zip(
+                            histogram.buckets, histogram.counts):
+                        lines.append(
+                            f'{name}_bucket{{{label},le="{bound}"}} {count}'
+                        )
+                    lines.append(
+                        f'{name}_bucket{{{label},le="+Inf"}} '
+                        f'{histogram.count}'
+                    )
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                    lines.append(
+                        f'{name}_count{{{label}}} {histogram.count}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.record_query(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    # Обёртка ставится на каждое подключение, а не только на подключения
+    # потока запроса: под ASGI запросы к БД идут из потоков sync_to_async,
+    # куда статистика запроса попадает через contextvars.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedSerializerMixin:
+    """Добавляет время to_representation в метрики текущего запроса.
+
+    Вложенные сериализаторы внутри идущего замера не считаются повторно,
+    у списка замеряется каждый элемент.
+    """
+
+    def to_representation(self, instance):
+        stats = _current.get()
+        if stats is None or stats.serializer_depth:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_time += time.perf_counter() - start
+            stats.serializer_depth -= 1
+
+
+def get_endpoint(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class MetricsMiddleware:
+    """Собирает SQL- и временные метрики по каждому эндпоинту.
+
+    Подключается настройкой METRICS_ENABLED. Результаты отдаются в
+    заголовке Server-Timing и агрегируются для /api/_metrics (только
+    администраторам). Время сериализации считают сериализаторы
+    с TimedSerializerMixin.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        connection_created.connect(
+            install_query_recorder, dispatch_uid='metrics_query_recorder'
+        )
+        for connection in connections.all():
+            install_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - start
+        endpoint = getattr(request, 'metrics_endpoint', None)
+        if endpoint is None:
+            return response
+        registry.observe(endpoint, stats, duration)
+        response['Server-Timing'] = ', '.join((
+            f'sql;dur={stats.sql_time * 1000:.1f};'
+            f'desc="{stats.queries} queries"',
+            f'serializer;dur={stats.serializer_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        if stats.queries > settings.METRICS_QUERY_BUDGET:
+            logger.warning(
+                '%s выполнил %d SQL-запросов при бюджете %d',
+                endpoint, stats.queries, settings.METRICS_QUERY_BUDGET
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if view_func is not metrics_view:
+            request.metrics_endpoint = get_endpoint(request, view_func)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
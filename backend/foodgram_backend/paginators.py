@@ -0,0 +1,37 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from foodgram_backend.constants import ESTIMATED_COUNT_FROM
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки, не считающий COUNT(*) по большим таблицам.
+
+    Для выборки без условий в PostgreSQL число строк берётся из
+    статистики планировщика (pg_class.reltuples). Оценка используется,
+    только если в таблице не меньше ESTIMATED_COUNT_FROM строк, иначе
+    и в остальных случаях считается точно.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = self.get_estimate()
+        if estimate is not None and estimate >= ESTIMATED_COUNT_FROM:
+            return estimate
+        return super().count
+
+    def get_estimate(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [self.object_list.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row else None
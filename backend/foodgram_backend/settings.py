@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -55,8 +56,23 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Метрики SQL и времени ответа по эндпоинтам (Server-Timing, /api/_metrics
+# для администраторов)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', 30))
+
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'foodgram_backend.metrics.MetricsMiddleware')
+
 ROOT_URLCONF = 'foodgram_backend.urls'
 
+# Асинхронные представления чтения (api.async_views); включаются в asgi.py
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False').lower() == 'true'
+
+# Автодополнение ингредиентов по индексу в памяти процесса
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -81,10 +97,30 @@ CSRF_TRUSTED_ORIGINS = ['https://ksfoodgram.zapto.org']
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Постоянные подключения: CONN_MAX_AGE секунд, перед повторным
+# использованием подключение проверяется (CONN_HEALTH_CHECKS).
+CONN_MAX_AGE = int(os.getenv('CONN_MAX_AGE', 60))
+CONN_HEALTH_CHECKS = os.getenv('CONN_HEALTH_CHECKS', 'True').lower() == 'true'
+
+# WAL и ожидание блокировки вместо "database is locked"
+# при нескольких воркерах (foodgram_backend.sqlite)
 DATABASES_SQL = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'foodgram_backend.sqlite',
         'NAME': BASE_DIR / 'data/db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': CONN_HEALTH_CHECKS,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+                'cache_size': -int(os.getenv('SQLITE_CACHE_KB', 65536)),
+                'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)),
+                'temp_store': 'MEMORY',
+            },
+        },
     }
 }
 
@@ -95,7 +131,13 @@ DATABASES_PSG = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': CONN_HEALTH_CHECKS,
+        # Для PgBouncer в режиме пула транзакций
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DISABLE_SERVER_SIDE_CURSORS', 'False'
+        ).lower() == 'true',
     }
 }
 
@@ -103,6 +145,64 @@ PSG = os.getenv('PSG', 'False').lower() == 'true'
 
 DATABASES = DATABASES_PSG if PSG else DATABASES_SQL
 
+# Реплики только для чтения: хосты PostgreSQL или файлы SQLite через пробел.
+# Запросы GET/HEAD читают с них, остальное идёт в основную базу
+# (foodgram_backend.db_router).
+DATABASE_REPLICAS = []
+for number, location in enumerate(os.getenv('DB_REPLICAS', '').split()):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    if PSG:
+        DATABASES[alias]['HOST'] = location
+    else:
+        DATABASES[alias]['NAME'] = location
+    DATABASE_REPLICAS.append(alias)
+
+# Сколько секунд после записи клиент читает из основной базы
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['foodgram_backend.db_router.PrimaryReplicaRouter']
+    MIDDLEWARE.insert(
+        1, 'foodgram_backend.db_router.ReplicaRoutingMiddleware'
+    )
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', LOCMEM_CACHE),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Версии ключей кеша ответов и метки чтения из основной базы должны видеть
+# все воркеры. LocMemCache у каждого процесса свой: с ним кеш ответов
+# выключен, а реплики не поддерживаются. Для одного процесса (runserver)
+# можно явно задать CACHE_SHARED=True.
+CACHE_SHARED = os.getenv(
+    'CACHE_SHARED', str(CACHES['default']['BACKEND'] != LOCMEM_CACHE)
+).lower() == 'true'
+if DATABASE_REPLICAS and not CACHE_SHARED:
+    raise ImproperlyConfigured(
+        'DB_REPLICAS требует общего для воркеров кеша (CACHE_BACKEND)'
+    )
+
+CACHE_TTL = int(os.getenv('CACHE_TTL', 60 * 60 * 24))
+RECIPE_CACHE_TTL = int(os.getenv('RECIPE_CACHE_TTL', 60 * 5))
+# Ключ перестановки коротких ссылок; после смены новые коды могут совпасть
+# с уже выданными, поэтому задаётся один раз.
+SHORT_LINK_KEY = os.getenv('SHORT_LINK_KEY') or SECRET_KEY or ''
+SHORT_LINK_CACHE_TTL = int(os.getenv('SHORT_LINK_CACHE_TTL', 60 * 60 * 24))
+
+# Лента подписок: рецепты авторов с числом подписчиков до FEED_FANOUT_LIMIT
+# раскладываются по лентам при публикации, остальные читаются при запросе.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 10000))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 50))
+# Сколько последних записей хранится в ленте одного пользователя.
+FEED_MAX_ITEMS = int(os.getenv('FEED_MAX_ITEMS', 500))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -146,6 +246,12 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Превью изображений собираются в фоновом потоке процесса; при False очередь
+# разбирает отдельный воркер: python manage.py process_images --loop
+IMAGE_WORKER_THREAD = os.getenv('IMAGE_WORKER_THREAD', 'True').lower() == 'true'
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 80))
+IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('IMAGE_MAX_UPLOAD_SIZE', 10 * 2 ** 20))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,30 @@
+"""SQLite с настройками для нескольких воркеров gunicorn.
+
+Помимо обычных параметров sqlite3.connect в OPTIONS понимает:
+- pragmas: словарь PRAGMA, которые выполняются при каждом подключении
+  (journal_mode=WAL, synchronous, busy_timeout, cache_size, mmap_size);
+- transaction_mode: как в Django 5.1, 'IMMEDIATE' берёт блокировку
+  записи в начале transaction.atomic(). Иначе транзакция, которая
+  сначала читает, а потом пишет, сразу получает "database is locked",
+  не дожидаясь busy_timeout.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        self.transaction_mode = params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            return super()._start_transaction_under_autocommit()
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
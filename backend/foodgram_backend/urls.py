@@ -3,14 +3,22 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
-from recipes.views import redirect_short_link
+from foodgram_backend.metrics import metrics_view
+from recipes.views import aredirect_short_link, redirect_short_link
+
+short_link_view = (
+    aredirect_short_link if settings.ASYNC_READ_VIEWS else redirect_short_link
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    path('s/<slug:short_link>/', redirect_short_link, name='redirect_link'),
+    path('s/<slug:short_link>/', short_link_view, name='redirect_link'),
 ]
 
+if settings.METRICS_ENABLED:
+    urlpatterns.insert(1, path('api/_metrics', metrics_view, name='metrics'))
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
@@ -1,41 +1,52 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
 
+from foodgram_backend.paginators import EstimatedCountPaginator
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
+from recipes.search import update_search_index
 
 admin.site.empty_value_display = '-пусто-'
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
+    autocomplete_fields = ('ingredient',)
+    extra = 1
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     search_fields = ('name__istartswith', )
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug')
+    search_fields = ('name', 'slug')
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'image',)
-    list_filter = ('tags__name',)
+    list_display = (
+        'name', 'author', 'image', 'favorites_count', 'in_carts_count'
+    )
+    list_select_related = ('author',)
+    list_filter = ('tags',)
     search_fields = ('author__username', 'name__istartswith', )
-    readonly_fields = ('short_link', 'favorites')
+    autocomplete_fields = ('author', 'tags')
+    readonly_fields = ('short_link', 'favorites_count', 'in_carts_count')
     inlines = (RecipeIngredientInline, )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = [
         (
             None,
             {
                 'fields': [
-                    'name', 'author', 'text', 'cooking_time',
+                    'name', 'author', 'text', 'cooking_time', 'tags',
                 ],
             }
         ),
@@ -43,14 +54,14 @@ class RecipeAdmin(admin.ModelAdmin):
             'Дополнительные параметры',
             {
                 'classes': ["collapse"],
-                'fields': ['favorites'],
+                'fields': ['favorites_count', 'in_carts_count'],
             }
         )
     ]
 
-    @admin.display(description='В избранном')
-    def favorites(self, obj):
-        return obj.favorites.all().count()
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_index([form.instance.pk])
 
     @admin.display(description="Изображение")
     def image(self, obj):
@@ -61,11 +72,20 @@ class RecipeAdmin(admin.ModelAdmin):
         return None
 
 
-@admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class UserRecipeAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username__istartswith', )
+    autocomplete_fields = ('user', 'recipe')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(ShoppingCart)
+class ShoppingCartAdmin(UserRecipeAdmin):
+    pass
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe')
+class FavoriteAdmin(UserRecipeAdmin):
+    pass
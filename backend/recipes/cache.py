@@ -0,0 +1,42 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram_backend.db_router import reads_from_replica
+
+CATALOG = 'catalog'
+RECIPES = 'recipes'
+
+
+def get_version(name):
+    """Текущая версия группы данных, по которой строятся ключи кеша."""
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(name):
+    cache.set(f'version:{name}', uuid.uuid4().hex, timeout=None)
+    if settings.DATABASE_REPLICAS:
+        cache.set(f'version_bumped:{name}', True,
+                  settings.REPLICA_STICKY_SECONDS)
+
+
+def can_store(names):
+    """Можно ли положить в кеш данные, прочитанные в текущем запросе.
+
+    Реплика могла ещё не получить изменения, из-за которых сменилась
+    версия, и устаревший ответ лёг бы в кеш под новой версией.
+    """
+    if not reads_from_replica():
+        return True
+    return not cache.get_many([f'version_bumped:{name}' for name in names])
+
+
+def get_short_link_key(short_link):
+    return f'short_link:{short_link}'
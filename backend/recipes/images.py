@@ -0,0 +1,155 @@
+import io
+import logging
+import os
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from foodgram_backend.constants import IMAGE_RENDITIONS
+from recipes.cache import RECIPES, bump_version
+from recipes.models import ImageTask
+
+logger = logging.getLogger(__name__)
+
+# Модель -> (поле с оригиналом, {поле превью: размер из IMAGE_RENDITIONS})
+TARGETS = {
+    'recipes.recipe': (
+        'image', {'image_card': 'card', 'image_detail': 'detail'}
+    ),
+    'users.myuser': ('avatar', {'avatar_thumbnail': 'avatar'}),
+}
+
+# Размер из IMAGE_RENDITIONS, до которого пересобирается сам оригинал.
+ORIGINAL = 'original'
+
+IMAGE_FORMAT, IMAGE_EXTENSION = (
+    ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+)
+
+
+def render(image, size):
+    width, height, crop = IMAGE_RENDITIONS[size]
+    if crop:
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail((width, height), Image.LANCZOS)
+    buffer = io.BytesIO()
+    # Новый файл собирается только из пикселей, без EXIF и прочих метаданных.
+    image.save(buffer, IMAGE_FORMAT, quality=settings.IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def process(label, object_id):
+    source_field, renditions = TARGETS[label]
+    model = apps.get_model(label)
+    instance = model.objects.filter(pk=object_id).first()
+    if instance is None:
+        return
+    source = getattr(instance, source_field)
+    source_name = source.name
+    image = None
+    if source:
+        with source.open('rb') as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image = image.convert('RGBA' if IMAGE_FORMAT == 'WEBP'
+                                  and 'A' in image.getbands() else 'RGB')
+    stem = os.path.splitext(os.path.basename(source_name or ''))[0]
+    created = []
+    for field, size in renditions.items():
+        rendition = getattr(instance, field)
+        if rendition:
+            rendition.delete(save=False)
+        if image is not None:
+            rendition.save(
+                f'{stem}_{size}.{IMAGE_EXTENSION}',
+                ContentFile(render(image, size)),
+                save=False
+            )
+            created.append(rendition.name)
+    updates = {
+        field: getattr(instance, field).name or None for field in renditions
+    }
+    # Загруженный файл отдаётся по URL как есть, поэтому оригинал тоже
+    # пересобирается: размер ограничен, EXIF с GPS и прочим не сохраняется.
+    original_suffix = f'_{ORIGINAL}.{IMAGE_EXTENSION}'
+    if image is not None and not source_name.endswith(original_suffix):
+        source.save(
+            f'{stem}{original_suffix}',
+            ContentFile(render(image, ORIGINAL)),
+            save=False
+        )
+        created.append(source.name)
+        updates[source_field] = source.name
+    # Пока шла обработка, изображение могли заменить - тогда результат
+    # устарел, а новое изображение уже стоит в очереди.
+    if not model.objects.filter(
+        pk=object_id, **{source_field: source_name}
+    ).update(**updates):
+        for name in created:
+            source.storage.delete(name)
+        return
+    if source_field in updates:
+        source.storage.delete(source_name)
+    bump_version(RECIPES)
+
+
+def process_pending(limit=None):
+    processed = 0
+    while limit is None or processed < limit:
+        task = ImageTask.objects.first()
+        if task is None:
+            break
+        # Задачу забирает тот процесс, чьё удаление сработало.
+        if not ImageTask.objects.filter(pk=task.pk).delete()[0]:
+            continue
+        try:
+            process(task.model, task.object_id)
+        except Exception:
+            logger.exception('Не удалось обработать %s', task)
+        processed += 1
+    return processed
+
+
+class ImageWorker:
+    """Фоновый поток процесса, разбирающий очередь ImageTask."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.thread = None
+
+    def wake(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='image-worker', daemon=True
+                )
+                self.thread.start()
+        self.event.set()
+
+    def run(self):
+        while True:
+            self.event.wait()
+            self.event.clear()
+            try:
+                process_pending()
+            except Exception:
+                logger.exception('Ошибка обработки очереди изображений')
+            finally:
+                close_old_connections()
+
+
+worker = ImageWorker()
+
+
+def enqueue(instance):
+    """Ставит объект в очередь на пересборку превью после коммита."""
+    label = instance._meta.label_lower
+    ImageTask.objects.get_or_create(model=label, object_id=instance.pk)
+    if settings.IMAGE_WORKER_THREAD:
+        transaction.on_commit(worker.wake)
@@ -0,0 +1,104 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from recipes.cache import CATALOG, get_version
+from recipes.models import Ingredient
+
+WORD_SEPARATOR = re.compile(r'[\W_]+')
+
+Snapshot = namedtuple(
+    'Snapshot',
+    ('rows', 'names', 'words', 'word_rows', 'version', 'built_at')
+)
+
+
+def normalize(value):
+    return value.strip().lower()
+
+
+class IngredientPrefixIndex:
+    """Индекс названий ингредиентов в памяти процесса для автодополнения.
+
+    Строится при первом обращении и перестраивается при смене версии
+    справочника (см. recipes.cache); INGREDIENT_INDEX_TTL ограничивает
+    устаревание индекса, если кеш не общий для процессов.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+    def get_snapshot(self):
+        snapshot = self.snapshot
+        version = get_version(CATALOG)
+        if snapshot is None or snapshot.version != version or (
+                time.monotonic() - snapshot.built_at
+                > settings.INGREDIENT_INDEX_TTL):
+            with self.lock:
+                if self.snapshot is snapshot:
+                    self.snapshot = self.build(version)
+                snapshot = self.snapshot
+        return snapshot
+
+    @staticmethod
+    def build(version):
+        rows = sorted(
+            (
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                # Снимок живёт до смены версии, поэтому не с реплики.
+                for pk, name, unit in Ingredient.objects.using(
+                    DEFAULT_DB_ALIAS
+                ).values_list(
+                    'id', 'name', 'measurement_unit'
+                )
+            ),
+            key=lambda row: (normalize(row['name']), row['id'])
+        )
+        names = [normalize(row['name']) for row in rows]
+        words = sorted(
+            (word, position)
+            for position, name in enumerate(names)
+            for word in WORD_SEPARATOR.split(name)[1:]
+            if word
+        )
+        return Snapshot(
+            rows=rows,
+            names=names,
+            words=[word for word, _ in words],
+            word_rows=[position for _, position in words],
+            version=version,
+            built_at=time.monotonic(),
+        )
+
+    def search(self, prefix, limit):
+        """Совпадение целиком, затем по началу названия, затем по слову."""
+        snapshot = self.get_snapshot()
+        prefix = normalize(prefix)
+        if not prefix:
+            return snapshot.rows[:limit]
+        positions = []
+        index = bisect_left(snapshot.names, prefix)
+        while (len(positions) < limit and index < len(snapshot.names)
+               and snapshot.names[index].startswith(prefix)):
+            positions.append(index)
+            index += 1
+        if len(positions) < limit:
+            found = set(positions)
+            word_positions = set()
+            index = bisect_left(snapshot.words, prefix)
+            while (index < len(snapshot.words)
+                   and snapshot.words[index].startswith(prefix)):
+                if snapshot.word_rows[index] not in found:
+                    word_positions.add(snapshot.word_rows[index])
+                index += 1
+            positions += sorted(word_positions)[:limit - len(positions)]
+        return [snapshot.rows[position] for position in positions]
+
+
+ingredient_index = IngredientPrefixIndex()
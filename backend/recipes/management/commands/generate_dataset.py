@@ -0,0 +1,296 @@
+import datetime
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from itertools import accumulate, islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from recipes.cache import CATALOG, RECIPES, bump_version
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, encode_short_link)
+from users.models import Subscription
+
+User = get_user_model()
+
+DISHES = (
+    'Салат', 'Суп', 'Запеканка', 'Пирог', 'Рагу', 'Паста', 'Омлет',
+    'Каша', 'Плов', 'Жаркое', 'Котлеты', 'Соус', 'Десерт', 'Смузи',
+)
+MIN_INGREDIENTS = 2
+MAX_INGREDIENTS = 20
+MAX_AMOUNT = 1000
+MAX_COOKING_TIME = 1500
+PUBLISHED_DAYS = 3 * 365
+
+
+class Zipf:
+    """Выбор из values с весом 1 / rank ** exponent по порядку values."""
+
+    def __init__(self, rng, values, exponent):
+        self.rng = rng
+        self.values = values
+        self.cum_weights = array('d', accumulate(
+            1 / rank ** exponent for rank in range(1, len(values) + 1)
+        ))
+
+    def choice(self):
+        return self.rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+    def sample(self, count, exclude=None):
+        """Не больше count разных значений, кроме exclude."""
+        count = min(count, len(self.values) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.rng.choices(
+                self.values, cum_weights=self.cum_weights,
+                k=count - len(chosen)
+            ))
+            chosen.discard(exclude)
+        return chosen
+
+
+@contextmanager
+def keep_pub_date():
+    # Иначе bulk_create поставит всем рецептам сегодняшнюю дату.
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Генерирует воспроизводимый набор пользователей, рецептов, '
+            'подписок, избранного и корзин для нагрузочных замеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='Подписок на пользователя в среднем'
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=30,
+            help='Рецептов в избранном у пользователя в среднем'
+        )
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Рецептов в корзине у пользователя в среднем'
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.0,
+            help='Показатель распределения популярности авторов, '
+                 'рецептов, ингредиентов и тегов'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--password',
+            help='Пароль всех пользователей; по умолчанию вход запрещён'
+        )
+        parser.add_argument(
+            '--no-feeds', action='store_true',
+            help='Не заполнять ленты подписок'
+        )
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.values_list('pk', 'name'))
+        tags = list(Tag.objects.all())
+        if not ingredients or not tags:
+            raise CommandError(
+                'Сначала загрузите ингредиенты и теги: manage.py import_csv'
+            )
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и рецепт')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = datetime.date.today()
+        zipf = options['zipf']
+        # Первые id новых строк: генерация не зависит от RETURNING
+        # и повторяется с тем же --seed на той же базе.
+        first_user = (User.objects.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+        first_recipe = (
+            Recipe.objects.aggregate(pk=Max('pk'))['pk'] or 0
+        ) + 1
+        users = range(first_user, first_user + options['users'])
+        recipes = range(first_recipe, first_recipe + options['recipes'])
+        self.rng.shuffle(ingredients)
+        self.rng.shuffle(tags)
+        self.ingredients = Zipf(self.rng, ingredients, zipf)
+        self.tags = Zipf(self.rng, tags, zipf)
+        # Одна и та же популярность авторов для рецептов и подписчиков.
+        self.authors = Zipf(self.rng, self.shuffled(users), zipf)
+        self.popular_recipes = Zipf(self.rng, self.shuffled(recipes), zipf)
+        self.ingredient_counts = Zipf(
+            self.rng, range(MIN_INGREDIENTS, MAX_INGREDIENTS + 1), zipf
+        )
+        self.tag_counts = Zipf(self.rng, range(1, len(tags) + 1), zipf)
+
+        with transaction.atomic(), keep_pub_date():
+            self.insert(User, self.generate_users(
+                users, make_password(options['password'])
+            ))
+            self.insert_recipes(recipes)
+            self.insert(Subscription, self.generate_subscriptions(
+                users, options['follows']
+            ))
+            self.insert(Favorite, self.generate_user_recipes(
+                Favorite, users, options['favorites']
+            ))
+            self.insert(ShoppingCart, self.generate_user_recipes(
+                ShoppingCart, users, options['carts']
+            ))
+            self.reset_sequences()
+            call_command('reconcile_counters', stdout=self.stdout)
+            self.insert(ShoppingListItem, (
+                ShoppingListItem(
+                    user_id=row['recipe__shoppingcart__user_id'],
+                    ingredient_id=row['ingredient_id'],
+                    amount=row['total_amount'],
+                )
+                # В корзинах новых пользователей только новые рецепты.
+                for row in ShoppingListItem.objects.live_totals().filter(
+                    recipe_id__gte=recipes.start
+                ).iterator()
+            ))
+            if not options['no_feeds']:
+                self.insert(FeedItem, self.generate_feeds(users))
+            call_command('rebuild_search_index', stdout=self.stdout)
+            transaction.on_commit(lambda: bump_version(RECIPES))
+            transaction.on_commit(lambda: bump_version(CATALOG))
+
+    def shuffled(self, values):
+        values = array('q', values)
+        self.rng.shuffle(values)
+        return values
+
+    def insert(self, model, objects):
+        start = time.perf_counter()
+        rows = 0
+        objects = iter(objects)
+        while batch := list(islice(objects, self.batch_size)):
+            model.objects.bulk_create(batch)
+            rows += len(batch)
+        self.report({model: rows}, start)
+
+    def report(self, counts, start):
+        elapsed = time.perf_counter() - start
+        rows = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(
+                f'{model._meta.label}: {count}'
+                for model, count in counts.items()
+            ) + f' за {elapsed:.2f} с '
+            f'({rows / elapsed if elapsed else rows:.0f} строк/с)'
+        ))
+
+    def insert_recipes(self, recipes):
+        # Ингредиенты и теги рецептов пишутся вслед за каждой пачкой
+        # рецептов, чтобы не держать в памяти строки всех рецептов.
+        start = time.perf_counter()
+        models = (Recipe, RecipeIngredient, Recipe.tags.through)
+        counts = dict.fromkeys(models, 0)
+        for first in range(recipes.start, recipes.stop, self.batch_size):
+            batch = {model: [] for model in models}
+            for pk in range(first, min(first + self.batch_size, recipes.stop)):
+                recipe, ingredients, tags = self.generate_recipe(pk)
+                batch[Recipe].append(recipe)
+                batch[RecipeIngredient].extend(ingredients)
+                batch[Recipe.tags.through].extend(tags)
+            for model, objects in batch.items():
+                model.objects.bulk_create(objects)
+                counts[model] += len(objects)
+        self.report(counts, start)
+
+    def reset_sequences(self):
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [User, Recipe]):
+                cursor.execute(sql)
+
+    def generate_users(self, users, password):
+        for pk in users:
+            yield User(
+                pk=pk, username=f'user{pk}', email=f'user{pk}@example.com',
+                first_name='Имя', last_name=f'Фамилия {pk}',
+                password=password
+            )
+
+    def generate_recipe(self, pk):
+        ingredients = sorted(self.ingredients.sample(
+            self.ingredient_counts.choice()
+        ))
+        tags = sorted(
+            self.tags.sample(self.tag_counts.choice()),
+            key=lambda tag: tag.pk
+        )
+        names = [name for _, name in ingredients]
+        recipe = Recipe(
+            pk=pk,
+            author_id=self.authors.choice(),
+            name=f'{self.rng.choice(DISHES)}: {names[0]}',
+            text=f'Ингредиенты: {", ".join(names)}.',
+            cooking_time=min(MAX_COOKING_TIME, max(1, round(
+                self.rng.lognormvariate(3.4, 0.6)
+            ))),
+            pub_date=self.today - datetime.timedelta(
+                days=self.rng.randrange(PUBLISHED_DAYS)
+            ),
+            short_link=encode_short_link(pk),
+            tags_mask=Tag.get_mask(tags),
+        )
+        recipe_ingredients = [
+            RecipeIngredient(
+                recipe_id=pk, ingredient_id=ingredient_id,
+                amount=min(MAX_AMOUNT, max(1, round(
+                    self.rng.lognormvariate(4, 1)
+                )))
+            )
+            for ingredient_id, _ in ingredients
+        ]
+        recipe_tags = [
+            Recipe.tags.through(recipe_id=pk, tag_id=tag.pk) for tag in tags
+        ]
+        return recipe, recipe_ingredients, recipe_tags
+
+    def generate_subscriptions(self, users, average):
+        for user_id in users:
+            count = round(self.rng.expovariate(1 / average))
+            for author_id in self.authors.sample(count, exclude=user_id):
+                yield Subscription(user_id=user_id, author_id=author_id)
+
+    def generate_user_recipes(self, model, users, average):
+        for user_id in users:
+            count = round(self.rng.expovariate(1 / average))
+            for recipe_id in self.popular_recipes.sample(count):
+                yield model(user_id=user_id, recipe_id=recipe_id)
+
+    def generate_feeds(self, users):
+        authors = User.objects.filter(
+            pk__range=(users.start, users.stop - 1),
+            recipes_count__gt=0, followers_count__gt=0,
+            followers_count__lte=settings.FEED_FANOUT_LIMIT
+        ).values_list('pk', flat=True)
+        for author_id in list(authors):
+            recipes = Recipe.objects.filter(author_id=author_id).order_by(
+                '-pub_date', '-pk'
+            ).values_list('pk', 'pub_date')[:settings.FEED_BACKFILL]
+            recipes = list(recipes)
+            for user_id in Subscription.objects.filter(
+                    author_id=author_id).values_list('user_id', flat=True):
+                for recipe_id, pub_date in recipes:
+                    yield FeedItem(
+                        user_id=user_id, recipe_id=recipe_id,
+                        author_id=author_id, pub_date=pub_date
+                    )
@@ -1,35 +1,156 @@
 import csv
+import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.cache import CATALOG, bump_version
 from recipes.models import Ingredient, Tag
 
-FILES = [
-    {
+DATA_DIR = settings.BASE_DIR.parent / 'data'
+
+MODELS = {
+    'ingredients': {
         'model': Ingredient,
-        'file_path': f'{settings.BASE_DIR.parent}\\data\\ingredients.csv',
         'fieldnames': ['name', 'measurement_unit'],
     },
-    {
+    'tags': {
         'model': Tag,
-        'file_path': f'{settings.BASE_DIR}\\recipes\\data\\tags.csv',
         'fieldnames': ['name', 'slug'],
     },
+}
+
+FILES = [
+    ('ingredients', DATA_DIR / 'ingredients.csv'),
+    ('tags', DATA_DIR / 'tags.csv'),
 ]
 
+JSON_CHUNK_SIZE = 64 * 1024
+NOT_SPACE = re.compile(r'\S')
+
+
+def read_csv(file, fieldnames):
+    yield from csv.DictReader(file, fieldnames=fieldnames)
+
+
+def read_json(file, fieldnames):
+    """Список объектов или фикстура Django с ключом "fields".
+
+    Файл читается кусками, элементы массива разбираются по одному:
+    в памяти только текущий кусок, как у CSV и JSON Lines.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, end_of_file = '', 0, False
+    # Что ждём дальше: '[', первый элемент или ']', элемент, ',' или ']'.
+    expected = '['
+    while True:
+        match = NOT_SPACE.search(buffer, position)
+        if match is not None and expected != 'item':
+            char = buffer[match.start()]
+            position = match.end()
+            if expected == '[' and char == '[':
+                expected = 'first'
+            elif expected in ('first', ',') and char == ']':
+                return
+            elif expected == 'first':
+                position, expected = match.start(), 'item'
+            elif expected == ',' and char == ',':
+                expected = 'item'
+            else:
+                raise CommandError(
+                    'Файл JSON должен содержать массив объектов, '
+                    f'а встретился символ {char!r}'
+                )
+            continue
+        if match is not None:
+            try:
+                item, end = decoder.raw_decode(buffer, match.start())
+            except json.JSONDecodeError:
+                end = None
+            # Значение у конца куска могло прочитаться не целиком.
+            if end is not None and (end < len(buffer) or end_of_file):
+                yield item.get('fields', item)
+                position, expected = end, ','
+                continue
+        if end_of_file:
+            raise CommandError('Файл JSON оборван или повреждён')
+        chunk = file.read(JSON_CHUNK_SIZE)
+        end_of_file = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+
+def read_json_lines(file, fieldnames):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+    '.jsonl': read_json_lines,
+}
+
 
 class Command(BaseCommand):
-    help = 'Import data from CSV files into the database'
-
-    def handle(self, *args, **kwargs):
-        for dic in FILES:
-            model = dic.get('model')
-            file_path = dic.get('file_path')
-            fieldnames = dic.get('fieldnames')
-            with open(file_path, 'r', encoding='utf-8') as csv_file:
-                reader = csv.DictReader(csv_file, fieldnames=fieldnames)
-                for row in reader:
-                    print(row)
-                    model.objects.create(**row)
-            self.stdout.write(self.style.SUCCESS('Данные загружены'))
+    help = 'Import ingredients and tags from CSV/JSON files into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Файл для загрузки (.csv, .json, .jsonl); '
+                 'по умолчанию загружаются data/ingredients.csv и tags.csv'
+        )
+        parser.add_argument(
+            '--model', choices=MODELS, default='ingredients',
+            help='Что содержит файл из --path'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Прочитать и загрузить данные, затем откатить транзакцию'
+        )
+
+    def handle(self, *args, **options):
+        files = FILES
+        if options['path']:
+            files = [(options['model'], options['path'])]
+        with transaction.atomic():
+            for name, path in files:
+                self.load(MODELS[name], path, options['batch_size'])
+            for tag in Tag.objects.filter(bit=None):
+                tag.assign_bit()
+            if options['dry_run']:
+                transaction.set_rollback(True)
+                self.stdout.write(self.style.WARNING('Изменения отменены'))
+            else:
+                transaction.on_commit(lambda: bump_version(CATALOG))
+
+    def load(self, config, path, batch_size):
+        model, fieldnames = config['model'], config['fieldnames']
+        reader = READERS.get(Path(path).suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        start = time.perf_counter()
+        before = model.objects.count()
+        rows = 0
+        with open(path, 'r', encoding='utf-8') as file:
+            objects = (
+                model(**{field: row[field] for field in fieldnames})
+                for row in reader(file, fieldnames)
+            )
+            while batch := list(islice(objects, batch_size)):
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                rows += len(batch)
+        created = model.objects.count() - before
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{path}: прочитано {rows}, добавлено {created}, '
+            f'пропущено {rows - created} за {elapsed:.2f} с '
+            f'({rows / elapsed if elapsed else rows:.0f} строк/с)'
+        ))
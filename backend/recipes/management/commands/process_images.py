@@ -0,0 +1,46 @@
+import time
+
+from django.apps import apps
+from django.core.management import BaseCommand
+
+from recipes.images import TARGETS, process_pending
+from recipes.models import ImageTask
+
+
+class Command(BaseCommand):
+    help = 'Собирает превью изображений из очереди ImageTask'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Работать постоянно, опрашивая очередь'
+        )
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Поставить в очередь все объекты без превью'
+        )
+
+    def handle(self, *args, **options):
+        if options['missing']:
+            for label, (source, renditions) in TARGETS.items():
+                model = apps.get_model(label)
+                queryset = model.objects.exclude(
+                    **{f'{source}__isnull': True}
+                ).exclude(**{source: ''}).filter(
+                    **{f'{next(iter(renditions))}__isnull': True}
+                )
+                ImageTask.objects.bulk_create(
+                    [
+                        ImageTask(model=label, object_id=pk)
+                        for pk in queryset.values_list('pk', flat=True)
+                    ],
+                    ignore_conflicts=True
+                )
+        while True:
+            processed = process_pending()
+            if processed:
+                self.stdout.write(f'Обработано изображений: {processed}')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
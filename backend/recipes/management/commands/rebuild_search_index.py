@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ids = list(Recipe.objects.values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            for start in range(0, len(ids), batch_size):
+                update_search_index(ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {len(ids)}'
+        ))
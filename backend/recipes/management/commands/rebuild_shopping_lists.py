@@ -0,0 +1,61 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает итоги списков покупок из корзин '
+            'и сверяет их с живым агрегатом')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить итоги, ничего не изменяя'
+        )
+
+    def get_differences(self):
+        live = {
+            (row['recipe__shoppingcart__user_id'], row['ingredient_id']):
+                row['total_amount']
+            for row in ShoppingListItem.objects.live_totals()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        return {
+            key: (stored.get(key), live.get(key))
+            for key in stored.keys() | live.keys()
+            if stored.get(key) != live.get(key)
+        }
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                ShoppingListItem.objects.all().delete()
+                ShoppingListItem.objects.bulk_create(
+                    (
+                        ShoppingListItem(
+                            user_id=row['recipe__shoppingcart__user_id'],
+                            ingredient_id=row['ingredient_id'],
+                            amount=row['total_amount'],
+                        )
+                        for row in ShoppingListItem.objects.live_totals()
+                    ),
+                    batch_size=1000
+                )
+            self.stdout.write(self.style.SUCCESS('Итоги пересобраны'))
+        differences = self.get_differences()
+        for (user_id, ingredient_id), (stored, live) in sorted(
+                differences.items()):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'сохранено {stored}, по корзине {live}'
+            )
+        if differences:
+            raise CommandError(f'Расхождений: {len(differences)}')
+        self.stdout.write(self.style.SUCCESS('Итоги совпадают с корзинами'))
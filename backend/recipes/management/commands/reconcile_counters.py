@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+# Модель, поле счётчика, модель со строками и её внешний ключ на модель.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def live_count(related_model, foreign_key):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{foreign_key: OuterRef('pk')}
+        ).order_by().values(foreign_key).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного, корзин, рецептов и подписчиков '
+            'с таблицами-источниками и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить счётчики, ничего не изменяя'
+        )
+
+    def handle(self, *args, **options):
+        drifted = 0
+        with transaction.atomic():
+            for model, field, related_model, foreign_key in COUNTERS:
+                live = live_count(related_model, foreign_key)
+                rows = model.objects.alias(live=live).exclude(
+                    **{field: F('live')}
+                )
+                count = rows.count()
+                if count and not options['check']:
+                    model.objects.filter(pk__in=rows.values('pk')).update(
+                        **{field: live}
+                    )
+                drifted += count
+                self.stdout.write(
+                    f'{model._meta.label}.{field}: расхождений {count}'
+                )
+        if drifted and options['check']:
+            raise CommandError(f'Расхождений: {drifted}')
+        self.stdout.write(self.style.SUCCESS('Счётчики совпадают'))
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:22
+
+from django.db import migrations, models
+
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def encode(number):
+    number += len(ALPHABET) ** 3
+    symbols = []
+    while number:
+        number, remainder = divmod(number, len(ALPHABET))
+        symbols.append(ALPHABET[remainder])
+    return ''.join(reversed(symbols))
+
+
+def fix_short_links(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    seen = set()
+    for pk, short_link in Recipe.objects.order_by('pk').values_list(
+            'pk', 'short_link'):
+        if short_link is None or short_link in seen:
+            Recipe.objects.filter(pk=pk).update(short_link=encode(pk))
+        else:
+            seen.add(short_link)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_short_links, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_link',
+            field=models.SlugField(max_length=16, null=True, unique=True, verbose_name='Короткая ссылка'),
+        ),
+    ]
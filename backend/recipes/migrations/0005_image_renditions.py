@@ -0,0 +1,41 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_short_link_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=150, verbose_name='Модель')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='Id объекта')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+            ],
+            options={
+                'verbose_name': 'Задача обработки изображения',
+                'verbose_name_plural': 'Задачи обработки изображений',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_card',
+            field=models.ImageField(blank=True, default=None, null=True, upload_to='recipes/renditions/', verbose_name='Картинка для карточки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_detail',
+            field=models.ImageField(blank=True, default=None, null=True, upload_to='recipes/renditions/', verbose_name='Картинка для страницы рецепта'),
+        ),
+        migrations.AddConstraint(
+            model_name='imagetask',
+            constraint=models.UniqueConstraint(fields=('model', 'object_id'), name='unique_image_task'),
+        ),
+    ]
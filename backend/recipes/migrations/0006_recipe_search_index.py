@@ -0,0 +1,52 @@
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipes_recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector)',
+    "UPDATE recipes_recipe r SET search_vector = "
+    "setweight(to_tsvector('russian', r.name), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(("
+    "SELECT string_agg(i.name, ' ') FROM recipes_recipeingredient ri "
+    "JOIN recipes_ingredient i ON i.id = ri.ingredient_id "
+    "WHERE ri.recipe_id = r.id), '')), 'B') || "
+    "setweight(to_tsvector('russian', r.text), 'C')",
+]
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+]
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+    "name, ingredients, text, tokenize='unicode61')",
+    "INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) "
+    "SELECT r.id, r.name, coalesce(("
+    "SELECT group_concat(i.name, ' ') FROM recipes_recipeingredient ri "
+    "JOIN recipes_ingredient i ON i.id = ri.ingredient_id "
+    "WHERE ri.recipe_id = r.id), ''), r.text FROM recipes_recipe r",
+]
+SQLITE_BACKWARD = [
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, ()):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -1,21 +1,71 @@
-import random
-import string
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When, Window
+from django.db.models.functions import RowNumber
 
-from foodgram_backend.constants import (MAX_NAME, MAX_OUT_NAME, MAX_SHORT_LINK,
-                                        MIN_VALUE)
+from foodgram_backend.constants import (FEED_FANOUT_BATCH, MAX_NAME,
+                                        MAX_OUT_NAME, MAX_SHORT_LINK,
+                                        MAX_TAG_BITS, MIN_VALUE,
+                                        SHORT_LINK_ALPHABET, SHORT_LINK_LENGTH)
+from users.models import Subscription
 
 
-def slug_random(num_char: int) -> str:
-    symbols = string.ascii_letters + string.digits
-    return ''.join(random.sample(symbols, num_char))
+def get_short_link_key():
+    """Множитель и сдвиг перестановки кодов из SHORT_LINK_KEY."""
+    digest = hashlib.sha256(settings.SHORT_LINK_KEY.encode()).digest()
+    block = len(SHORT_LINK_ALPHABET) ** SHORT_LINK_LENGTH
+    multiplier = int.from_bytes(digest[:16], 'big') % block | 1
+    # Взаимно простой с 62 множитель делает перестановку обратимой.
+    while multiplier % 31 == 0:
+        multiplier += 2
+    return multiplier, int.from_bytes(digest[16:], 'big') % block
+
+
+def encode_short_link(number: int) -> str:
+    """Base62-код по pk, переставленному ключом внутри блока 62^6.
+
+    Соседние pk дают несвязанные коды, поэтому ссылки не перебрать.
+    Коды не короче SHORT_LINK_LENGTH и не пересекаются со старыми.
+    """
+    block = len(SHORT_LINK_ALPHABET) ** SHORT_LINK_LENGTH
+    multiplier, shift = get_short_link_key()
+    high, low = divmod(number, block)
+    number = high * block + (low * multiplier + shift) % block
+    symbols = []
+    while number or len(symbols) < SHORT_LINK_LENGTH:
+        number, remainder = divmod(number, len(SHORT_LINK_ALPHABET))
+        symbols.append(SHORT_LINK_ALPHABET[remainder])
+    return ''.join(reversed(symbols))
 
 
 User = get_user_model()
 
+_batch_sync = ContextVar('batch_sync', default=False)
+
+
+@contextmanager
+def batch_sync():
+    """Производные данные внутри блока пересчитывает сам вызывающий код.
+
+    Обработчики сигналов на каждую строку (итоги списков покупок,
+    счётчики, маска тегов) при этом ничего не делают.
+    """
+    token = _batch_sync.set(True)
+    try:
+        yield
+    finally:
+        _batch_sync.reset(token)
+
+
+def in_batch_sync():
+    return _batch_sync.get()
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -51,6 +101,13 @@ class Tag(models.Model):
         unique=True,
         verbose_name='Slug'
     )
+    bit = models.PositiveSmallIntegerField(
+        verbose_name='Бит в маске тегов рецепта',
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ('slug',)
@@ -60,6 +117,35 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def get_mask(tags):
+        mask = 0
+        for tag in tags:
+            if tag.bit is not None:
+                mask |= 1 << tag.bit
+        return mask
+
+    def assign_bit(self):
+        """Выдаёт тегу свободный бит и отмечает его у рецептов с тегом."""
+        used = set(Tag.objects.exclude(bit=None).values_list('bit', flat=True))
+        free = [bit for bit in range(MAX_TAG_BITS) if bit not in used]
+        if not free:
+            return
+        self.bit = free[0]
+        Tag.objects.filter(pk=self.pk).update(bit=self.bit)
+        self.set_bit(Recipe.objects.filter(tags=self))
+
+    def release_bit(self, recipes=None):
+        if self.bit is None:
+            return
+        if recipes is None:
+            recipes = Recipe.objects.filter(tags=self)
+        recipes.update(tags_mask=F('tags_mask').bitand(~(1 << self.bit)))
+
+    def set_bit(self, recipes):
+        if self.bit is not None:
+            recipes.update(tags_mask=F('tags_mask').bitor(1 << self.bit))
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(
@@ -77,6 +163,20 @@ class Recipe(models.Model):
         null=True,
         default=None
     )
+    image_card = models.ImageField(
+        verbose_name='Картинка для карточки',
+        upload_to='recipes/renditions/',
+        null=True,
+        blank=True,
+        default=None
+    )
+    image_detail = models.ImageField(
+        verbose_name='Картинка для страницы рецепта',
+        upload_to='recipes/renditions/',
+        null=True,
+        blank=True,
+        default=None
+    )
     text = models.TextField(
         verbose_name='Текстовое описание',
     )
@@ -89,6 +189,21 @@ class Recipe(models.Model):
         Tag,
         verbose_name='Тег'
     )
+    tags_mask = models.BigIntegerField(
+        verbose_name='Маска тегов',
+        default=0,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления',
         validators=(
@@ -105,12 +220,18 @@ class Recipe(models.Model):
     short_link = models.SlugField(
         verbose_name='Короткая ссылка',
         null=True,
+        unique=True,
         max_length=MAX_SHORT_LINK
     )
 
     class Meta:
         ordering = ('-pub_date',)
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'], name='recipe_author_date_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -118,12 +239,15 @@ class Recipe(models.Model):
         return self.name[:MAX_OUT_NAME]
 
     def save(self, *args, **kwargs):
-        if self.short_link is None:
-            slug = slug_random(MAX_SHORT_LINK)
-            while Recipe.objects.filter(short_link=slug).exists():
-                slug = slug_random(MAX_SHORT_LINK)
-            self.short_link = slug
         super(Recipe, self).save(*args, **kwargs)
+        # Код - перестановка pk, а pk известен только после INSERT, поэтому
+        # при создании нужен второй запрос. Случайный код сэкономил бы его
+        # ценой проверок на совпадения; создание рецепта и так в транзакции.
+        if self.short_link is None:
+            self.short_link = encode_short_link(self.pk)
+            Recipe.objects.filter(pk=self.pk).update(
+                short_link=self.short_link
+            )
 
 
 class RecipeIngredient(models.Model):
@@ -162,6 +286,66 @@ class RecipeIngredient(models.Model):
         return f'{self.recipe} {self.ingredient}'
 
 
+class UserRecipeManager(models.Manager):
+    """Пакетное добавление и удаление рецептов пользователя."""
+
+    def add_recipes(self, user_id, recipe_ids):
+        """Добавляет рецепты одним INSERT, возвращает id добавленных."""
+        with transaction.atomic():
+            self.lock_user(user_id)
+            existing = set(self.filter(
+                user_id=user_id, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+            added = [pk for pk in recipe_ids if pk not in existing]
+            # Под блокировкой конфликтов нет; ignore_conflicts страхует от
+            # записи в обход API (админка, shell), которая блокировку не
+            # берёт: вместо IntegrityError расходится только счётчик, его
+            # чинит reconcile_counters.
+            self.bulk_create(
+                [self.model(user_id=user_id, recipe_id=pk) for pk in added],
+                ignore_conflicts=True
+            )
+            self.model.update_counters(added, 1)
+        return added
+
+    def remove_recipes(self, user_id, recipe_ids):
+        """Удаляет рецепты одним DELETE, возвращает id удалённых."""
+        with transaction.atomic():
+            self.lock_user(user_id)
+            queryset = self.filter(user_id=user_id, recipe_id__in=recipe_ids)
+            removed = list(queryset.values_list('recipe_id', flat=True))
+            # Счётчики и списки покупок обновляются ниже и у наследников,
+            # обработчики на каждую строку их не трогают.
+            with batch_sync():
+                queryset.delete()
+            self.model.update_counters(removed, -1)
+        return removed
+
+    @staticmethod
+    def lock_user(user_id):
+        # Параллельные пакеты одного пользователя идут по очереди, и
+        # проверка существующих строк остаётся верной до записи. В SQLite
+        # то же даёт BEGIN IMMEDIATE, select_for_update там пропускается.
+        User.objects.select_for_update().filter(
+            pk=user_id
+        ).values_list('pk', flat=True).first()
+
+
+class ShoppingCartManager(UserRecipeManager):
+
+    def add_recipes(self, user_id, recipe_ids):
+        with transaction.atomic():
+            added = super().add_recipes(user_id, recipe_ids)
+            ShoppingListItem.objects.add_recipes(user_id, added)
+        return added
+
+    def remove_recipes(self, user_id, recipe_ids):
+        with transaction.atomic():
+            removed = super().remove_recipes(user_id, recipe_ids)
+            ShoppingListItem.objects.add_recipes(user_id, removed, sign=-1)
+        return removed
+
+
 class ShoppingCartFavorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -174,14 +358,28 @@ class ShoppingCartFavorite(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = UserRecipeManager()
+    # Поле рецепта со счётчиком пользователей, добавивших его сюда.
+    counter_field = None
+
     class Meta:
         abstract = True
 
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def update_counters(cls, recipe_ids, delta):
+        if recipe_ids:
+            Recipe.objects.filter(pk__in=recipe_ids).update(**{
+                cls.counter_field: F(cls.counter_field) + delta
+            })
+
 
 class ShoppingCart(ShoppingCartFavorite):
+    objects = ShoppingCartManager()
+    counter_field = 'in_carts_count'
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -195,6 +393,8 @@ class ShoppingCart(ShoppingCartFavorite):
 
 
 class Favorite(ShoppingCartFavorite):
+    counter_field = 'favorites_count'
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -205,3 +405,281 @@ class Favorite(ShoppingCartFavorite):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
         default_related_name = 'favorites'
+
+
+class ShoppingListManager(models.Manager):
+
+    def apply_delta(self, user_ids, amounts):
+        """Прибавляет amounts {ingredient_id: количество} к итогам users."""
+        amounts = {key: value for key, value in amounts.items() if value}
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic():
+            existing = set(self.filter(
+                user_id__in=user_ids, ingredient_id__in=amounts
+            ).values_list('user_id', 'ingredient_id'))
+            # Недостающие строки вставляются с нулём и увеличиваются
+            # общим UPDATE: строку, которую успела вставить параллельная
+            # транзакция, INSERT пропустит, а UPDATE прибавит к ней.
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=0
+                    )
+                    for user_id in user_ids
+                    for ingredient_id, amount in amounts.items()
+                    if amount > 0
+                    and (user_id, ingredient_id) not in existing
+                ],
+                ignore_conflicts=True
+            )
+            self.filter(
+                user_id__in=user_ids, ingredient_id__in=amounts
+            ).update(amount=F('amount') + Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in amounts.items()
+                ),
+                default=Value(0)
+            ))
+            self.filter(user_id__in=user_ids, amount__lte=0).delete()
+
+    def apply_recipe_delta(self, recipe_id, amounts):
+        """Прибавляет amounts к итогам всех, у кого рецепт в корзине."""
+        self.apply_delta(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('user_id', flat=True),
+            amounts
+        )
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        if not recipe_ids:
+            return
+        self.apply_delta([user_id], {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by().values('ingredient_id').annotate(
+                total_amount=Sum('amount')
+            ).values_list('ingredient_id', 'total_amount')
+        })
+
+    def add_recipe(self, user_id, recipe_id, sign=1):
+        self.add_recipes(user_id, [recipe_id], sign)
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.add_recipe(user_id, recipe_id, sign=-1)
+
+    def live_totals(self):
+        return RecipeIngredient.objects.filter(
+            recipe__shoppingcart__isnull=False
+        ).values(
+            'recipe__shoppingcart__user_id', 'ingredient_id'
+        ).annotate(total_amount=Sum('amount'))
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        default_related_name = 'shopping_list'
+
+    def __str__(self):
+        return f'{self.user_id} {self.ingredient_id} {self.amount}'
+
+
+class ImageTask(models.Model):
+    model = models.CharField(
+        max_length=MAX_NAME,
+        verbose_name='Модель'
+    )
+    object_id = models.PositiveBigIntegerField(
+        verbose_name='Id объекта'
+    )
+    created = models.DateTimeField(
+        verbose_name='Создана',
+        auto_now_add=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['model', 'object_id'],
+                name='unique_image_task'
+            )
+        ]
+        ordering = ('pk',)
+        verbose_name = 'Задача обработки изображения'
+        verbose_name_plural = 'Задачи обработки изображений'
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+
+class FeedManager(models.Manager):
+    """Ленты подписок авторов с числом подписчиков до FEED_FANOUT_LIMIT.
+
+    Записи пишутся пачками по FEED_FANOUT_BATCH подписчиков, в ленте
+    остаются FEED_MAX_ITEMS последних рецептов.
+    """
+
+    def fan_out(self, recipe):
+        """Кладёт новый рецепт в ленты подписчиков автора."""
+        followers_count = User.objects.filter(
+            pk=recipe.author_id
+        ).values_list('followers_count', flat=True).first()
+        if (followers_count is None
+                or followers_count > settings.FEED_FANOUT_LIMIT):
+            return
+        for user_ids in self.follower_batches(recipe.author_id):
+            with transaction.atomic():
+                self.bulk_create(
+                    [
+                        self.model(
+                            user_id=user_id, recipe_id=recipe.pk,
+                            author_id=recipe.author_id,
+                            pub_date=recipe.pub_date
+                        )
+                        for user_id in user_ids
+                    ],
+                    ignore_conflicts=True
+                )
+                self.truncate(user_ids)
+
+    def backfill(self, user_ids, author_id):
+        """Добавляет в ленты последние рецепты автора."""
+        recipes = list(Recipe.objects.filter(
+            author_id=author_id
+        ).order_by('-pub_date', '-pk').values_list(
+            'pk', 'pub_date'
+        )[:settings.FEED_BACKFILL])
+        if not recipes:
+            return
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date
+                )
+                for user_id in user_ids for recipe_id, pub_date in recipes
+            ),
+            batch_size=FEED_FANOUT_BATCH,
+            ignore_conflicts=True
+        )
+        self.truncate(user_ids)
+
+    def backfill_followers(self, author_id):
+        """Заполняет ленты всех подписчиков, когда автор снова в fan-out."""
+        for user_ids in self.follower_batches(author_id):
+            with transaction.atomic():
+                self.backfill(user_ids, author_id)
+
+    def remove_author(self, author_id):
+        """Убирает автора из всех лент, когда его читают при запросе."""
+        while True:
+            pks = list(self.filter(
+                author_id=author_id
+            ).values_list('pk', flat=True)[:FEED_FANOUT_BATCH])
+            if not pks:
+                return
+            self.filter(pk__in=pks).delete()
+
+    def trim(self, user_id, author_id):
+        """Убирает из ленты рецепты автора после отписки."""
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def truncate(self, user_ids):
+        """Оставляет в лентах FEED_MAX_ITEMS последних записей."""
+        stale = list(self.filter(user_id__in=user_ids).annotate(
+            position=Window(
+                RowNumber(), partition_by=[F('user_id')],
+                order_by=[F('pub_date').desc(), F('recipe_id').desc()]
+            )
+        ).filter(
+            position__gt=settings.FEED_MAX_ITEMS
+        ).values_list('pk', flat=True))
+        if stale:
+            self.filter(pk__in=stale).delete()
+
+    @staticmethod
+    def follower_batches(author_id):
+        user_ids = list(Subscription.objects.filter(
+            author_id=author_id
+        ).order_by('user_id').values_list('user_id', flat=True))
+        for start in range(0, len(user_ids), FEED_FANOUT_BATCH):
+            yield user_ids[start:start + FEED_FANOUT_BATCH]
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок пользователя (fan-out при публикации)."""
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateField(
+        verbose_name='Дата публикации'
+    )
+
+    objects = FeedManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date'], name='feed_user_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        default_related_name = 'feed_items'
+
+    def __str__(self):
+        return f'{self.user_id} {self.recipe_id}'
@@ -0,0 +1,108 @@
+"""Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+В PostgreSQL индекс хранится в столбце recipes_recipe.search_vector
+(tsvector с GIN-индексом, русская морфология), в SQLite - в теневой
+таблице FTS5 recipes_recipe_fts. Обе структуры создаёт миграция 0006
+и обновляют вызовы update_search_index.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'recipes_recipe_fts'
+WORD = re.compile(r'\w+')
+# Рецептов в одном обновлении индекса: держит число параметров запроса
+# ниже лимита SQLite.
+SEARCH_INDEX_BATCH = 500
+
+INGREDIENT_NAMES = (
+    'SELECT {aggregate} FROM recipes_recipeingredient ri '
+    'JOIN recipes_ingredient i ON i.id = ri.ingredient_id '
+    'WHERE ri.recipe_id = r.id'
+)
+
+POSTGRES_UPDATE = (
+    "UPDATE recipes_recipe r SET search_vector = "
+    "setweight(to_tsvector('russian', r.name), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(({ingredients}), '')), 'B') "
+    "|| setweight(to_tsvector('russian', r.text), 'C') "
+    "WHERE r.id = ANY(%s)"
+).format(ingredients=INGREDIENT_NAMES.format(
+    aggregate="string_agg(i.name, ' ')"
+))
+POSTGRES_QUERY = "websearch_to_tsquery('russian', %s)"
+
+SQLITE_DELETE = f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({{ids}})'
+SQLITE_INSERT = (
+    f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+    'SELECT r.id, r.name, coalesce(({ingredients}), \'\'), r.text '
+    'FROM recipes_recipe r WHERE r.id IN ({{ids}})'
+).format(ingredients=INGREDIENT_NAMES.format(
+    aggregate="group_concat(i.name, ' ')"
+))
+# Веса столбцов bm25: название, ингредиенты, описание.
+SQLITE_RANK = f'bm25({FTS_TABLE}, 10.0, 5.0, 1.0)'
+
+
+def update_search_index(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), SEARCH_INDEX_BATCH):
+            batch = recipe_ids[start:start + SEARCH_INDEX_BATCH]
+            if connection.vendor == 'postgresql':
+                cursor.execute(POSTGRES_UPDATE, [batch])
+            elif connection.vendor == 'sqlite':
+                ids = ', '.join(['%s'] * len(batch))
+                cursor.execute(SQLITE_DELETE.format(ids=ids), batch)
+                cursor.execute(SQLITE_INSERT.format(ids=ids), batch)
+
+
+def remove_from_search_index(recipe_id):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(SQLITE_DELETE.format(ids='%s'), [recipe_id])
+
+
+def to_fts_query(value):
+    # Слова пользователя как префиксы в кавычках: синтаксис FTS5 не нужен.
+    return ' '.join(f'"{word}"*' for word in WORD.findall(value))
+
+
+def search_recipes(queryset, value):
+    """Оставляет рецепты, подходящие под запрос, с аннотацией search_rank."""
+    if connection.vendor == 'postgresql':
+        matches = RawSQL(
+            'SELECT id FROM recipes_recipe '
+            f'WHERE search_vector @@ {POSTGRES_QUERY}', [value]
+        )
+        rank = RawSQL(
+            f'ts_rank("recipes_recipe"."search_vector", {POSTGRES_QUERY})',
+            [value], output_field=FloatField()
+        )
+        return queryset.filter(id__in=matches).annotate(search_rank=rank)
+    if connection.vendor == 'sqlite':
+        value = to_fts_query(value)
+        if not value:
+            return queryset.none().annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            )
+        # Одно соединение с таблицей FTS5: bm25() считается для строк,
+        # найденных MATCH, а не подзапросом на каждый рецепт. Аннотация,
+        # а не extra(select): по ней фильтрует курсорная пагинация.
+        return queryset.annotate(search_rank=RawSQL(
+            f'-{SQLITE_RANK}', [], output_field=FloatField()
+        )).extra(
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = "recipes_recipe"."id"',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[value]
+        )
+    return queryset.filter(name__icontains=value).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
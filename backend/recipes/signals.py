@@ -0,0 +1,258 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from recipes.cache import CATALOG, RECIPES, bump_version, get_short_link_key
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, in_batch_sync)
+from recipes.search import remove_from_search_index, update_search_index
+from users.models import Subscription
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created and not in_batch_sync():
+        ShoppingListItem.objects.add_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    if in_batch_sync():
+        return
+    # pre_delete срабатывает до каскадного удаления ингредиентов рецепта.
+    ShoppingListItem.objects.remove_recipe(
+        instance.user_id, instance.recipe_id
+    )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, raw=False, **kwargs):
+    instance._saved_row = None
+    if instance.pk is not None and not raw and not in_batch_sync():
+        instance._saved_row = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_shopping_lists_on_save(sender, instance, created, raw=False,
+                                  **kwargs):
+    # Админка, shell и прочие правки мимо RecipeCreateSerializer.update.
+    if raw or in_batch_sync():
+        return
+    deltas = {instance.recipe_id: {instance.ingredient_id: instance.amount}}
+    saved = getattr(instance, '_saved_row', None)
+    if saved is not None:
+        recipe_id, ingredient_id, amount = saved
+        delta = deltas.setdefault(recipe_id, {})
+        delta[ingredient_id] = delta.get(ingredient_id, 0) - amount
+    for recipe_id, delta in deltas.items():
+        ShoppingListItem.objects.apply_recipe_delta(recipe_id, delta)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def update_shopping_lists_on_delete(sender, instance, origin=None, **kwargs):
+    # При удалении рецепта, ингредиента или пользователя строки уходят
+    # каскадом: итоги поправят обработчики корзины или каскад итогов.
+    direct = isinstance(origin, RecipeIngredient) or (
+        isinstance(origin, QuerySet) and origin.model is RecipeIngredient
+    )
+    if direct and not in_batch_sync():
+        ShoppingListItem.objects.apply_recipe_delta(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount}
+        )
+
+
+@receiver(pre_save, sender=Ingredient)
+def remember_ingredient_name(sender, instance, raw=False, **kwargs):
+    instance._saved_name = None
+    if instance.pk is not None and not raw:
+        instance._saved_name = Ingredient.objects.filter(
+            pk=instance.pk
+        ).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_renamed_ingredient(sender, instance, created, raw=False,
+                               **kwargs):
+    saved_name = getattr(instance, '_saved_name', None)
+    if created or raw or saved_name in (None, instance.name):
+        return
+    update_search_index(RecipeIngredient.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_ingredient_recipes(sender, instance, **kwargs):
+    # После каскада строк рецептов с этим ингредиентом уже не найти.
+    instance._recipe_ids = list(RecipeIngredient.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Ingredient)
+def reindex_deleted_ingredient(sender, instance, **kwargs):
+    update_search_index(getattr(instance, '_recipe_ids', ()))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_catalog_version(sender, **kwargs):
+    bump_version(CATALOG)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(sender, instance, **kwargs):
+    cache.delete(get_short_link_key(instance.short_link))
+    remove_from_search_index(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipes_version(sender, **kwargs):
+    bump_version(RECIPES)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_recipes_version_for_author(sender, created=False, update_fields=None,
+                                    **kwargs):
+    # У нового пользователя ещё нет рецептов, а вход в систему обновляет
+    # только last_login, которого в рецептах нет.
+    if created or update_fields is not None and (
+            set(update_fields) == {'last_login'}):
+        return
+    bump_version(RECIPES)
+
+
+@receiver(post_save, sender=Tag)
+def assign_tag_bit(sender, instance, **kwargs):
+    # Срабатывает и для loaddata/raw-сохранений, в отличие от Tag.save.
+    if instance.bit is None:
+        instance.assign_bit()
+
+
+@receiver(pre_delete, sender=Tag)
+def release_tag_bit(sender, instance, **kwargs):
+    instance.release_bit()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def sync_tags_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if in_batch_sync():
+            return
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            # Маска пишется и в экземпляр: его следующий save() её не затрёт.
+            instance.tags_mask = Tag.get_mask(instance.tags.all())
+            Recipe.objects.filter(pk=instance.pk).update(
+                tags_mask=instance.tags_mask
+            )
+    elif action == 'pre_clear':
+        instance.release_bit()
+    elif action == 'post_add':
+        instance.set_bit(Recipe.objects.filter(pk__in=pk_set))
+    elif action == 'post_remove':
+        instance.release_bit(Recipe.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_added_recipe(sender, instance, created, **kwargs):
+    if created and not in_batch_sync():
+        sender.update_counters([instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_removed_recipe(sender, instance, **kwargs):
+    if not in_batch_sync():
+        sender.update_counters([instance.recipe_id], -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_author(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is not None and (
+            update_fields is None or 'author' in update_fields):
+        instance._saved_author_id = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('author_id', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_author_recipes(sender, instance, created, **kwargs):
+    saved_author_id = getattr(
+        instance, '_saved_author_id', instance.author_id
+    )
+    instance._saved_author_id = instance.author_id
+    if saved_author_id == instance.author_id and not created:
+        return
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=F('recipes_count') + 1
+    )
+    if saved_author_id is not None and saved_author_id != instance.author_id:
+        User.objects.filter(pk=saved_author_id).update(
+            recipes_count=F('recipes_count') - 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=F('recipes_count') - 1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        # Запись в тысячи лент не держит транзакцию создания рецепта.
+        transaction.on_commit(lambda: FeedItem.objects.fan_out(instance))
+
+
+def get_followers_count(author_id):
+    # Счётчик уже обновлён: обработчики users подключены раньше recipes.
+    return User.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    followers_count = get_followers_count(instance.author_id)
+    if followers_count <= settings.FEED_FANOUT_LIMIT:
+        FeedItem.objects.backfill([instance.user_id], instance.author_id)
+    elif followers_count == settings.FEED_FANOUT_LIMIT + 1:
+        # Автор перешёл к чтению при запросе: его записи в лентах лишние.
+        transaction.on_commit(
+            lambda: FeedItem.objects.remove_author(instance.author_id)
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def trim_feed(sender, instance, **kwargs):
+    FeedItem.objects.trim(instance.user_id, instance.author_id)
+    if get_followers_count(instance.author_id) == settings.FEED_FANOUT_LIMIT:
+        # Автор вернулся к fan-out: рецептов, прочитанных при запросе,
+        # в лентах подписчиков нет.
+        transaction.on_commit(
+            lambda: FeedItem.objects.backfill_followers(instance.author_id)
+        )
@@ -0,0 +1,307 @@
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from recipes.images import IMAGE_EXTENSION, process, render
+from recipes.management.commands import import_csv
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, encode_short_link)
+from recipes.search import search_recipes, update_search_index
+from users.testing import create_user
+
+
+class ShoppingListTestCase(TestCase):
+    """Два пользователя, два рецепта в корзинах и сверка итогов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [create_user(f'user{number}') for number in range(2)]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.users[0], name=f'Рецепт {number}',
+                text='Описание', cooking_time=10
+            )
+            for number in range(2)
+        ]
+        for recipe, amounts in zip(cls.recipes, ((10, 20), (5,))):
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+                for ingredient, amount in zip(cls.ingredients, amounts)
+            )
+        for user in cls.users:
+            ShoppingCart.objects.create(user=user, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.users[0], recipe=cls.recipes[1])
+        cls.row = RecipeIngredient.objects.get(
+            recipe=cls.recipes[0], ingredient=cls.ingredients[0]
+        )
+
+    def assert_totals_match(self):
+        live = {
+            (row['recipe__shoppingcart__user_id'], row['ingredient_id']):
+                row['total_amount']
+            for row in ShoppingListItem.objects.live_totals()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        self.assertEqual(stored, live)
+
+
+class ShoppingListSyncTests(ShoppingListTestCase):
+    """Итоги списков покупок совпадают с корзинами после правок рецептов."""
+
+    def test_initial_totals(self):
+        self.assert_totals_match()
+
+    def test_change_amount(self):
+        self.row.amount = 15
+        self.row.save()
+        self.assert_totals_match()
+
+    def test_change_ingredient(self):
+        self.row.ingredient = self.ingredients[2]
+        self.row.save()
+        self.assert_totals_match()
+
+    def test_add_row(self):
+        RecipeIngredient.objects.create(
+            recipe=self.recipes[1], ingredient=self.ingredients[2], amount=7
+        )
+        self.assert_totals_match()
+
+    def test_delete_row(self):
+        self.row.delete()
+        self.assert_totals_match()
+
+    def test_delete_rows_queryset(self):
+        RecipeIngredient.objects.filter(
+            ingredient=self.ingredients[0]
+        ).delete()
+        self.assert_totals_match()
+
+    def test_delete_recipe(self):
+        self.recipes[0].delete()
+        self.assert_totals_match()
+
+    def test_delete_ingredient(self):
+        self.ingredients[0].delete()
+        self.assert_totals_match()
+
+
+class UserRecipeBatchTests(ShoppingListTestCase):
+    """Пакетные добавление и удаление держат счётчики и списки покупок."""
+
+    def assert_counters(self):
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                recipe.favorites_count, recipe.favorites.count()
+            )
+            self.assertEqual(
+                recipe.in_carts_count, recipe.shoppingcart.count()
+            )
+
+    def test_add_existing(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        added = ShoppingCart.objects.add_recipes(self.users[1].pk, ids)
+        self.assertEqual(added, [self.recipes[1].pk])
+        self.assertEqual(
+            ShoppingCart.objects.add_recipes(self.users[1].pk, ids), []
+        )
+        self.assertEqual(
+            Favorite.objects.add_recipes(self.users[0].pk, ids), ids
+        )
+        self.assert_counters()
+        self.assert_totals_match()
+
+    def test_remove(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        Favorite.objects.add_recipes(self.users[0].pk, ids)
+        removed = ShoppingCart.objects.remove_recipes(self.users[0].pk, ids)
+        self.assertEqual(sorted(removed), ids)
+        self.assertEqual(
+            Favorite.objects.remove_recipes(self.users[0].pk, ids[:1]),
+            ids[:1]
+        )
+        self.assertFalse(
+            ShoppingCart.objects.filter(user=self.users[0]).exists()
+        )
+        self.assert_counters()
+        self.assert_totals_match()
+
+
+class SearchTests(TestCase):
+    """Поиск учитывает название рецепта и его ингредиенты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.ingredient = Ingredient.objects.create(
+            name='Укроп', measurement_unit='г'
+        )
+        cls.by_name = Recipe.objects.create(
+            author=author, name='Борщ', text='Описание', cooking_time=10
+        )
+        cls.by_ingredient = Recipe.objects.create(
+            author=author, name='Суп', text='Описание', cooking_time=10
+        )
+        Recipe.objects.create(
+            author=author, name='Каша', text='Описание', cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.by_ingredient, ingredient=cls.ingredient, amount=5
+        )
+        # Рецепты индексирует сериализатор, здесь их создают напрямую.
+        update_search_index(Recipe.objects.values_list('pk', flat=True))
+
+    def search(self, value):
+        return list(search_recipes(
+            Recipe.objects.all(), value
+        ).order_by('-search_rank', 'pk').values_list('pk', flat=True))
+
+    def test_name_and_ingredient(self):
+        self.assertEqual(self.search('борщ'), [self.by_name.pk])
+        self.assertEqual(self.search('укроп'), [self.by_ingredient.pk])
+        self.assertEqual(self.search('пицца'), [])
+
+    def test_rename_ingredient(self):
+        self.ingredient.name = 'Петрушка'
+        self.ingredient.save()
+        self.assertEqual(self.search('укроп'), [])
+        self.assertEqual(self.search('петрушка'), [self.by_ingredient.pk])
+
+    def test_delete_ingredient(self):
+        self.ingredient.delete()
+        self.assertEqual(self.search('укроп'), [])
+
+
+class ImageProcessTests(TestCase):
+    """Воркер пересобирает оригинал: без EXIF и не больше 2048 пикселей."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        exif[0x8825] = {1: 'N', 2: (55.0, 45.0, 0.0)}
+        buffer = io.BytesIO()
+        Image.new('RGB', (3000, 1500), 'red').save(
+            buffer, 'JPEG', exif=exif
+        )
+        self.recipe = Recipe(
+            author=create_user('author'), name='Рецепт', text='Описание',
+            cooking_time=10
+        )
+        self.recipe.image.save(
+            'photo.jpg', ContentFile(buffer.getvalue()), save=False
+        )
+        self.recipe.save()
+
+    def test_original_normalized(self):
+        uploaded = self.recipe.image.name
+        process('recipes.recipe', self.recipe.pk)
+        self.recipe.refresh_from_db()
+        self.assertTrue(
+            self.recipe.image.name.endswith(f'_original.{IMAGE_EXTENSION}')
+        )
+        self.assertFalse(self.recipe.image.storage.exists(uploaded))
+        with Image.open(self.recipe.image.path) as image:
+            self.assertEqual(image.size, (2048, 1024))
+            self.assertFalse(image.getexif())
+        self.assertTrue(self.recipe.image_card)
+        self.assertTrue(self.recipe.image_detail)
+
+    def test_processed_once(self):
+        process('recipes.recipe', self.recipe.pk)
+        self.recipe.refresh_from_db()
+        original = self.recipe.image.name
+        process('recipes.recipe', self.recipe.pk)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, original)
+
+    def test_replaced_during_processing(self):
+        uploaded = self.recipe.image.name
+
+        def replace(image, size):
+            Recipe.objects.filter(pk=self.recipe.pk).update(
+                image='recipes/new.jpg'
+            )
+            return render(image, size)
+
+        with mock.patch('recipes.images.render', side_effect=replace):
+            process('recipes.recipe', self.recipe.pk)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, 'recipes/new.jpg')
+        self.assertFalse(self.recipe.image_card)
+        storage = self.recipe.image.storage
+        self.assertTrue(storage.exists(uploaded))
+        self.assertEqual(storage.listdir('recipes')[1], [
+            uploaded.split('/')[-1]
+        ])
+
+
+class ShortLinkTests(SimpleTestCase):
+    """Коды коротких ссылок уникальны и не выдают соседние pk."""
+
+    def test_unique(self):
+        numbers = list(range(1, 5000)) + [62 ** 6 - 1, 62 ** 6, 62 ** 7 + 5]
+        links = [encode_short_link(number) for number in numbers]
+        self.assertEqual(len(set(links)), len(links))
+        self.assertTrue(all(len(link) >= 6 for link in links))
+
+    def test_not_sequential(self):
+        links = [encode_short_link(number) for number in (1, 2, 3)]
+        self.assertNotEqual(links, sorted(links))
+        self.assertNotEqual(links[0][:-1], links[1][:-1])
+
+    def test_keyed(self):
+        link = encode_short_link(1)
+        with override_settings(SHORT_LINK_KEY='другой ключ'):
+            self.assertNotEqual(encode_short_link(1), link)
+
+
+class ReadJSONTests(SimpleTestCase):
+    """JSON для import_csv разбирается по элементам при любом размере куска."""
+
+    items = [
+        {'name': 'Соль', 'measurement_unit': 'г'},
+        {'model': 'recipes.tag', 'fields': {'name': 'Обед', 'slug': 'lunch'}},
+    ]
+
+    def read(self, text):
+        return list(import_csv.read_json(io.StringIO(text), None))
+
+    def test_chunk_boundaries(self):
+        text = json.dumps(self.items, ensure_ascii=False, indent=2)
+        expected = [self.items[0], self.items[1]['fields']]
+        for size in (1, 5, import_csv.JSON_CHUNK_SIZE):
+            with self.subTest(size=size), mock.patch.object(
+                    import_csv, 'JSON_CHUNK_SIZE', size):
+                self.assertEqual(self.read(text), expected)
+
+    def test_empty_array(self):
+        self.assertEqual(self.read(' [ ] '), [])
+
+    def test_invalid(self):
+        for text in ('', '[{"name": "Соль"}', '[{}, ]', '{"name": "Соль"}'):
+            with self.subTest(text=text), self.assertRaises(CommandError):
+                self.read(text)
@@ -1,8 +1,41 @@
-from django.shortcuts import redirect
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
 
+from recipes.cache import get_short_link_key
 from recipes.models import Recipe
 
 
+def short_link_response(pk):
+    response = redirect(f'/recipes/{pk}/', permanent=True)
+    patch_cache_control(
+        response, public=True, max_age=settings.SHORT_LINK_CACHE_TTL
+    )
+    return response
+
+
 def redirect_short_link(request, short_link):
-    pk = Recipe.objects.get(short_link=short_link).pk
-    return redirect(f'/recipes/{pk}/')
+    key = get_short_link_key(short_link)
+    pk = cache.get(key)
+    if pk is None:
+        pk = get_object_or_404(
+            Recipe.objects.values_list('pk', flat=True),
+            short_link=short_link
+        )
+        cache.set(key, pk, settings.SHORT_LINK_CACHE_TTL)
+    return short_link_response(pk)
+
+
+async def aredirect_short_link(request, short_link):
+    key = get_short_link_key(short_link)
+    pk = await cache.aget(key)
+    if pk is None:
+        pk = await Recipe.objects.filter(
+            short_link=short_link
+        ).values_list('pk', flat=True).afirst()
+        if pk is None:
+            raise Http404('No Recipe matches the given query.')
+        await cache.aset(key, pk, settings.SHORT_LINK_CACHE_TTL)
+    return short_link_response(pk)
@@ -1,23 +1,20 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from foodgram_backend.paginators import EstimatedCountPaginator
 from users.models import MyUser, Subscription
 
 
 class MyUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets
     fieldsets += (
-        ('Рецепты и подписчики', {'fields': ('recipes', 'subscribers')}),
+        ('Рецепты и подписчики', {
+            'fields': ('recipes_count', 'followers_count')
+        }),
     )
-    readonly_fields = ('recipes', 'subscribers')
-
-    @admin.display(description='Рецепты')
-    def recipes(self, obj):
-        return obj.recipes.all().count()
-
-    @admin.display(description='Подписчики')
-    def subscribers(self, obj):
-        return obj.followers.all().count()
+    readonly_fields = ('recipes_count', 'followers_count')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(MyUser, MyUserAdmin)
@@ -26,5 +23,8 @@ admin.site.register(MyUser, MyUserAdmin)
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
-    list_filter = ('user', 'author')
+    list_select_related = ('user', 'author')
     search_fields = ('user__username__istartswith', )
+    autocomplete_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='avatar_thumbnail',
+            field=models.ImageField(blank=True, default=None, null=True, upload_to='users/renditions/', verbose_name='Превью аватара'),
+        ),
+    ]
@@ -32,6 +32,23 @@ class MyUser(AbstractUser):
         null=True,
         default=None
     )
+    avatar_thumbnail = models.ImageField(
+        'Превью аватара',
+        upload_to='users/renditions/',
+        null=True,
+        blank=True,
+        default=None
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False
+    )
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
 
@@ -0,0 +1,20 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import MyUser, Subscription
+
+
+@receiver(post_save, sender=Subscription)
+def count_added_follower(sender, instance, created, **kwargs):
+    if created:
+        MyUser.objects.filter(pk=instance.author_id).update(
+            followers_count=F('followers_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def count_removed_follower(sender, instance, **kwargs):
+    MyUser.objects.filter(pk=instance.author_id).update(
+        followers_count=F('followers_count') - 1
+    )
@@ -0,0 +1,9 @@
+from users.models import MyUser as User
+
+
+def create_user(name):
+    """Пользователь для тестов с паролем password."""
+    return User.objects.create_user(
+        username=name, email=f'{name}@example.com', password='password',
+        first_name='Имя', last_name='Фамилия'
+    )